@@ -0,0 +1,240 @@
+"""
+Ingest benchmark for the Kafka connector.
+
+Drives Connector.attach() end-to-end with an in-process fake consumer that
+replays synthetic JSON messages, writing into a DuckLake catalog kept in a
+local DuckDB (or SQLite) file with a local directory as DATA_PATH, so no
+Kafka, Postgres or MinIO is needed. Every scenario runs in its own process
+and reports msgs/sec, peak RSS and data files written per batch.
+
+    python -m benchmarks.ingest --messages 200000 --width 20 --depth 2 \
+        --batch-sizes 1000,10000,50000 --decoders arrow,pandas
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+from typing import Any
+
+import yaml
+
+from lake.connector.kafka import Connector
+
+
+class FakeMessage:
+    __slots__ = ("_topic", "_partition", "_offset", "_value")
+
+    def __init__(self, topic: str, partition: int, offset: int, value: bytes):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._value = value
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+    def key(self):
+        return None
+
+    def timestamp(self):
+        return (1, 0)
+
+    def error(self):
+        return None
+
+
+class FakeConsumer:
+    """Replays pre-generated payloads round-robin over partitions; raises KeyboardInterrupt when drained."""
+    def __init__(self, payloads: list[bytes], topic: str = "bench", partitions: int = 4):
+        self.messages = [
+            FakeMessage(topic, index % partitions, index // partitions, payload)
+            for index, payload in enumerate(payloads)
+        ]
+        self.position = 0
+
+    def consume(self, num_messages: int = 1, timeout: float = -1):
+        if self.position >= len(self.messages):
+            # consume_batch/attach treat this as a user interrupt and shut down cleanly
+            raise KeyboardInterrupt
+        batch = self.messages[self.position:self.position + num_messages]
+        self.position += len(batch)
+        return batch
+
+    def commit(self, message=None, offsets=None, asynchronous=True):
+        pass
+
+    def get_watermark_offsets(self, partition, timeout=None, cached=False):
+        return 0, len(self.messages)
+
+    def unsubscribe(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def synthetic_record(index: int, width: int, depth: int, rng: random.Random) -> dict:
+    record: dict[str, Any] = {"id": index}
+    for field in range(width):
+        kind = field % 4
+        if kind == 0:
+            record[f"int_{field}"] = rng.randint(0, 1 << 31)
+        elif kind == 1:
+            record[f"float_{field}"] = rng.random()
+        elif kind == 2:
+            record[f"str_{field}"] = f"value-{rng.randint(0, 1000)}"
+        else:
+            record[f"bool_{field}"] = rng.random() > 0.5
+    if depth > 0:
+        record["child"] = synthetic_record(index, max(width // 2, 1), depth - 1, rng)
+    return record
+
+
+def synthetic_payloads(messages: int, width: int, depth: int, seed: int = 7) -> list[bytes]:
+    rng = random.Random(seed)
+    return [json.dumps(synthetic_record(index, width, depth, rng)).encode() for index in range(messages)]
+
+
+class LocalLakeConnector(Connector):
+    """Kafka connector attached to a local DuckLake catalog and fed by a FakeConsumer."""
+    fake_consumer: Any = None
+
+    def _register_sources(self):
+        pass
+
+    def _attach_lake(self):
+        root = self.DEST.storage.scope
+        catalog = self.DEST.catalog.database
+        self.execute(
+            f"ATTACH 'ducklake:{catalog}' AS {self.DEST.catalog.lake_alias} (DATA_PATH '{root}/data/');"
+        )
+
+    def _connectivity_assessment(self):
+        pass
+
+    def open_consumer(self, group: str, topics: list[str]):
+        self._consumers.append(self.fake_consumer)
+        return self.fake_consumer
+
+
+def write_config(workdir: str, batch_size: int, decoder: str, catalog: str) -> str:
+    catalog_path = os.path.join(workdir, "catalog.ducklake")
+    config = {
+        "SRC": {
+            "stream": {
+                "ingest_topics": ["bench"],
+                "ingest_table": "bench_events",
+                "group_id": "bench",
+                "batch_size": batch_size,
+                "decoder": decoder,
+                "flush_rows": batch_size,
+                "flush_interval": 3600,
+            },
+        },
+        "DEST": {
+            "catalog": {
+                "database": f"sqlite:{catalog_path}" if catalog == "sqlite" else catalog_path,
+                "lake_alias": "lake",
+            },
+            "storage": {"scope": workdir, "style": "path"},
+        },
+    }
+    path = os.path.join(workdir, "config.yml")
+    with open(path, "w") as yaml_out:
+        yaml.safe_dump(config, yaml_out)
+    return path
+
+
+def count_data_files(workdir: str) -> tuple[int, int]:
+    files, size = 0, 0
+    for root, _, names in os.walk(os.path.join(workdir, "data")):
+        for name in names:
+            if name.endswith(".parquet"):
+                files += 1
+                size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def run_scenario(options: dict, results) -> None:
+    workdir = tempfile.mkdtemp(prefix="lake-bench-")
+    try:
+        payloads = synthetic_payloads(options["messages"], options["width"], options["depth"])
+        config_path = write_config(workdir, options["batch_size"], options["decoder"], options["catalog"])
+        connector = LocalLakeConnector(config_path)
+        connector.fake_consumer = FakeConsumer(payloads, partitions=options["partitions"])
+        started = time.perf_counter()
+        connector.attach()
+        elapsed = time.perf_counter() - started
+        rows = connector.execute(f"SELECT count(*) FROM {connector.SRC.stream.ingest_table}").fetchone()[0]
+        files, size = count_data_files(workdir)
+        batches = max(rows // options["batch_size"], 1)
+        results.put({
+            **options,
+            "rows": rows,
+            "seconds": elapsed,
+            "msgs_per_sec": rows / elapsed,
+            "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "files": files,
+            "files_per_batch": files / batches,
+            "avg_file_kib": size / max(files, 1) / 1024,
+        })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmarks.ingest", description="Kafka -> DuckLake ingest benchmark")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--width", type=int, default=16, help="scalar fields per (nested) object")
+    parser.add_argument("--depth", type=int, default=1, help="levels of nested objects per message")
+    parser.add_argument("--partitions", type=int, default=4)
+    parser.add_argument("--batch-sizes", default="1000,10000,50000")
+    parser.add_argument("--decoders", default="arrow,pandas")
+    parser.add_argument("--catalog", choices=["duckdb", "sqlite"], default="duckdb")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    header = f"{'decoder':<8} {'batch':>7} {'rows':>9} {'msgs/sec':>10} {'peak RSS MiB':>13} {'files':>6} {'files/batch':>12} {'avg file KiB':>13}"
+    print(header)
+    print("-" * len(header))
+    for decoder in args.decoders.split(","):
+        for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+            options = {
+                "messages": args.messages,
+                "width": args.width,
+                "depth": args.depth,
+                "partitions": args.partitions,
+                "batch_size": batch_size,
+                "decoder": decoder,
+                "catalog": args.catalog,
+            }
+            process = ctx.Process(target=run_scenario, args=(options, results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(f"{decoder:<8} {batch_size:>7} scenario failed with exit code {process.exitcode}")
+                continue
+            row = results.get()
+            print(
+                f"{decoder:<8} {batch_size:>7} {row['rows']:>9} {row['msgs_per_sec']:>10.0f} {row['peak_rss_mib']:>13.1f} "
+                f"{row['files']:>6} {row['files_per_batch']:>12.2f} {row['avg_file_kib']:>13.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
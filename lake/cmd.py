@@ -1,7 +1,55 @@
 import argparse
 import os
+import sys
+from datetime import datetime, timezone
+import pyarrow.csv as pa_csv
 from lake.connector import load_connector
-from lake.render import serve
+from lake.connector.core import CHANGE_TYPES, EXPORT_FORMATS, STREAM_BATCH_ROWS, DuckLakeManager
+from lake.supervisor import Supervisor
+from lake.util.logger import logger, log_to_stderr
+from lake.util.metrics import start_metrics_server
+
+
+def parse_timestamp(value: str) -> int:
+    """Parse an ISO-8601 timestamp (UTC unless it carries an offset) or epoch milliseconds into epoch milliseconds."""
+    if value.isdigit():
+        return int(value)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def parse_offsets(value: str) -> dict[tuple[str, int], int]:
+    """Parse topic:partition:offset[,topic:partition:offset...] into {(topic, partition): offset}."""
+    offsets = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        topic, partition, offset = item.rsplit(":", 2)
+        offsets[(topic, int(partition))] = int(offset)
+    return offsets
+
+
+def write_diff(args) -> None:
+    """Write the changed rows of a table as CSV to stdout (logs go to stderr)."""
+    log_to_stderr(logger)
+    manager = DuckLakeManager(args.config)
+    writer = None
+    try:
+        for batch in manager.snapshot_diff(
+            args.table,
+            start_snapshot=args.from_snapshot,
+            end_snapshot=args.to_snapshot,
+            since=args.since,
+            until=args.until,
+            change_types=args.change_type,
+        ):
+            if writer is None:
+                writer = pa_csv.CSVWriter(sys.stdout.buffer, batch.schema)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+        sys.stdout.flush()
 
 def main():
     """
@@ -36,6 +84,12 @@ def main():
         default='resources/config.yml',
         help="path to config file included SRC/DEST"
     )
+    parser_serve.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="expose Prometheus metrics on http://127.0.0.1:{port}/metrics"
+    )
     parser_attach = subparsers.add_parser(
         "attach",
         help="attack ducklake to message broker",
@@ -48,11 +102,259 @@ def main():
         default='resources/config.yml',
         help="path to config file included SRC/DEST"
     )
+    parser_attach.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=1,
+        help="number of ingest processes to run in the consumer group (partitions are spread over them)"
+    )
+    parser_attach.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="expose Prometheus metrics on http://127.0.0.1:{port}/metrics (worker N of --workers uses port+N)"
+    )
+    parser_attach.add_argument(
+        "--from-timestamp",
+        type=parse_timestamp,
+        default=None,
+        help="replay every assigned partition from this time (ISO-8601, UTC by default, or epoch milliseconds) instead of the stored offsets"
+    )
+    parser_attach.add_argument(
+        "--from-offsets",
+        type=parse_offsets,
+        default=None,
+        help="replay from explicit offsets, topic:partition:offset[,...] (wins over --from-timestamp for those partitions)"
+    )
+    parser_refresh = subparsers.add_parser(
+        "refresh",
+        help="incrementally refresh the aggregates declared in stream.aggregates",
+    )
+    parser_refresh.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        required=True,
+        default='resources/config.yml',
+        help="path to config file included SRC/DEST"
+    )
+    parser_refresh.add_argument(
+        "--interval",
+        "-i",
+        type=float,
+        default=None,
+        help="keep running and refresh every INTERVAL seconds (default: refresh once and exit)"
+    )
+    parser_backfill = subparsers.add_parser(
+        "backfill",
+        help="copy the SRC.postgres tables declared in SRC.backfill into the lake (resumable, incremental after the first run)",
+    )
+    parser_backfill.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        required=True,
+        default='resources/config.yml',
+        help="path to config file included SRC/DEST"
+    )
+    parser_backfill.add_argument(
+        "--table",
+        "-t",
+        action="append",
+        default=None,
+        help="only backfill this source/target table (repeatable, default: all of SRC.backfill)"
+    )
+    parser_backfill.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=4,
+        help="number of key-range slices copied concurrently (one postgres connection each)"
+    )
+    parser_backfill.add_argument(
+        "--full",
+        action="store_true",
+        help="re-copy the whole table instead of only rows changed since the last run (abandons an unfinished run)"
+    )
+    parser_files = subparsers.add_parser(
+        "ingest-files",
+        help="load new/changed SRC.storage objects declared in SRC.files into the lake",
+    )
+    parser_files.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        required=True,
+        default='resources/config.yml',
+        help="path to config file included SRC/DEST"
+    )
+    parser_files.add_argument(
+        "--table",
+        "-t",
+        action="append",
+        default=None,
+        help="only ingest the SRC.files entries targeting this table (repeatable, default: all)"
+    )
+    parser_files.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=4,
+        help="number of object batches loaded concurrently"
+    )
+    parser_maintain = subparsers.add_parser(
+        "maintain",
+        help="merge small files, expire old snapshots and delete unreferenced files (DEST.maintenance)",
+    )
+    parser_maintain.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        required=True,
+        default='resources/config.yml',
+        help="path to config file included SRC/DEST"
+    )
+    parser_maintain.add_argument(
+        "--interval",
+        "-i",
+        type=float,
+        default=None,
+        help="keep running and maintain every INTERVAL seconds (default: run once and exit)"
+    )
+    parser_diff = subparsers.add_parser(
+        "diff",
+        help="write rows added/removed between two lake snapshots as CSV to stdout",
+    )
+    parser_diff.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        required=True,
+        default='resources/config.yml',
+        help="path to config file included SRC/DEST"
+    )
+    parser_diff.add_argument(
+        "--table",
+        "-t",
+        type=str,
+        required=True,
+        help="lake table to diff"
+    )
+    parser_diff.add_argument(
+        "--from-snapshot",
+        type=int,
+        default=None,
+        help="first snapshot id (inclusive, default: first snapshot since --since)"
+    )
+    parser_diff.add_argument(
+        "--to-snapshot",
+        type=int,
+        default=None,
+        help="last snapshot id (inclusive, default: last snapshot until --until)"
+    )
+    parser_diff.add_argument(
+        "--since",
+        type=str,
+        default=None,
+        help="only snapshots committed at/after this timestamp (e.g. '2025-06-01 12:00:00')"
+    )
+    parser_diff.add_argument(
+        "--until",
+        type=str,
+        default=None,
+        help="only snapshots committed at/before this timestamp"
+    )
+    parser_diff.add_argument(
+        "--change-type",
+        action="append",
+        choices=CHANGE_TYPES,
+        default=None,
+        help="keep only these change types (repeatable, default: all)"
+    )
+    parser_export = subparsers.add_parser(
+        "export",
+        help="stream the result of a query to a parquet/csv file (local path or s3://) in constant memory",
+    )
+    parser_export.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        required=True,
+        default='resources/config.yml',
+        help="path to config file included SRC/DEST"
+    )
+    parser_export.add_argument(
+        "--query",
+        "-q",
+        type=str,
+        required=True,
+        help="read query to export (prefix with @ to read it from a file, e.g. @extract.sql)"
+    )
+    parser_export.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        required=True,
+        help="destination file, a local path or s3://bucket/key"
+    )
+    parser_export.add_argument(
+        "--format",
+        "-f",
+        choices=EXPORT_FORMATS,
+        default=None,
+        help="file format (default: from the output suffix, parquet otherwise)"
+    )
+    parser_export.add_argument(
+        "--batch-size",
+        type=int,
+        default=STREAM_BATCH_ROWS,
+        help="rows per record batch held in memory while writing local files"
+    )
     args = parser.parse_args()
     if args.command == 'attach':
-        cnn = load_connector("kafka",args.config)
-        cnn.attach()
+        if args.from_timestamp is not None or args.from_offsets:
+            # resolved once, before any worker starts: every worker then resumes from the stored offsets
+            load_connector("kafka",args.config).replay_from(args.from_timestamp, args.from_offsets)
+        if args.workers > 1:
+            Supervisor(args.config, args.workers, metrics_port=args.metrics_port).run()
+        else:
+            if args.metrics_port:
+                start_metrics_server(args.metrics_port)
+            cnn = load_connector("kafka",args.config)
+            cnn.attach()
+    if args.command == 'refresh':
+        cnn = load_connector("materialize",args.config)
+        if args.interval:
+            cnn.run(args.interval)
+        else:
+            cnn.refresh()
+    if args.command == 'export':
+        query = args.query
+        if query.startswith("@"):
+            with open(query[1:]) as query_file:
+                query = query_file.read()
+        manager = DuckLakeManager(args.config)
+        manager.export(query, args.output, args.format, batch_size=args.batch_size)
+    if args.command == 'diff':
+        write_diff(args)
+    if args.command == 'backfill':
+        cnn = load_connector("backfill",args.config)
+        cnn.backfill(args.table, workers=args.workers, full=args.full)
+    if args.command == 'ingest-files':
+        cnn = load_connector("files",args.config)
+        cnn.ingest(args.table, workers=args.workers)
+    if args.command == 'maintain':
+        cnn = load_connector("maintain",args.config)
+        if args.interval:
+            cnn.run(args.interval)
+        else:
+            cnn.maintain()
     if args.command == 'serve':
+        # the dashboard module starts rendering on import, keep it out of the other commands
+        from lake.render import serve
+        if args.metrics_port:
+            start_metrics_server(args.metrics_port)
         serve()
 
 
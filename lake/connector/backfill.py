@@ -0,0 +1,235 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import duckdb
+from lake.connector.core import DuckLakeManager, quote_identifier
+from lake.util.conf_loader import BackfillCnn
+from lake.util.logger import logger
+from lake.util.metrics import registry
+
+BACKFILL_ROWS = registry.counter("lake_backfill_rows_total", "Rows copied from SRC.postgres into the lake", ("table",))
+
+
+class Connector(DuckLakeManager):
+    """
+    Bulk copy of SRC.postgres tables (SRC.backfill) into the lake.
+    Each run splits the integer `key` range of a table into slices that are copied in parallel,
+    one cursor (and Postgres connection) per worker. A slice and its checkpoint row commit in the
+    same lake transaction, so an interrupted run resumes with the slices that are still missing.
+    After the first (full) run, runs are incremental: rows whose `watermark` column moved past the
+    previous run are replaced, or, without a watermark, rows with a key above the previous maximum are appended.
+    """
+    runs_table: str = "backfill_runs"
+    slices_table: str = "backfill_slices"
+
+    def __init__(self, config_path):
+        super(Connector, self).__init__(config_path)
+        if self.SRC.postgres is None:
+            raise ValueError("backfill needs SRC.postgres to be configured")
+        self.execute(f"use {self.DEST.catalog.lake_alias};")
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.runs_table} "
+            "(source VARCHAR, run_id BIGINT, mode VARCHAR, key_lower BIGINT, key_upper BIGINT, "
+            "watermark_from VARCHAR, watermark_to VARCHAR, slices INTEGER, "
+            "started_at TIMESTAMP WITH TIME ZONE, finished_at TIMESTAMP WITH TIME ZONE);"
+        )
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.slices_table} "
+            "(source VARCHAR, run_id BIGINT, slice INTEGER, rows BIGINT, completed_at TIMESTAMP WITH TIME ZONE);"
+        )
+
+    def backfill(self, tables: list[str] | None = None, workers: int = 4, full: bool = False) -> None:
+        """
+        Copy every configured table (or only `tables`) into the lake, resuming unfinished runs.
+        `full` abandons an unfinished run and starts a full copy instead.
+        """
+        for table in self.SRC.backfill:
+            if tables and table.table not in tables and self._target(table) not in tables:
+                continue
+            started = time.perf_counter()
+            run = self._unfinished_run(table)
+            if run is not None and full:
+                logger.warning(f"abandoning unfinished {run['mode']} backfill run {run['run_id']} of {table.table} for a full run")
+                run = self._plan_run(table, full, abandon=run["run_id"])
+            elif run is not None:
+                logger.info(f"resuming backfill run {run['run_id']} of {table.table}")
+            else:
+                run = self._plan_run(table, full)
+            if run is None:
+                logger.info(f"backfill of {table.table} is up to date")
+                continue
+            copied = self._copy_slices(table, run, workers)
+            self.execute(
+                f"UPDATE {self.runs_table} SET finished_at = now() WHERE source = ? AND run_id = ?",
+                [table.table, run["run_id"]],
+            )
+            logger.info(
+                f"backfilled {table.table} -> {self._target(table)} ({run['mode']} run {run['run_id']}, "
+                f"{copied} rows) in {time.perf_counter() - started:.2f}s"
+            )
+
+    def _target(self, table: BackfillCnn) -> str:
+        return table.target or table.table.split(".")[-1]
+
+    def _source(self, table: BackfillCnn) -> str:
+        return f"{self.SRC.postgres.lake_alias}.{table.table}"
+
+    def _unfinished_run(self, table: BackfillCnn) -> dict | None:
+        row = self.execute(
+            f"SELECT run_id, mode, key_lower, key_upper, watermark_from, watermark_to, slices FROM {self.runs_table} "
+            "WHERE source = ? AND finished_at IS NULL ORDER BY run_id DESC LIMIT 1",
+            [table.table],
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("run_id", "mode", "key_lower", "key_upper", "watermark_from", "watermark_to", "slices"), row))
+
+    def _plan_run(self, table: BackfillCnn, full: bool, abandon: int | None = None) -> dict | None:
+        """
+        Freeze the key range (and watermark range) of a new run so that resuming it copies the same rows.
+        The unfinished run `abandon` is forgotten in the same transaction (a full run clears the target anyway).
+        """
+        previous = self.execute(
+            f"SELECT run_id, key_upper, watermark_to FROM {self.runs_table} "
+            "WHERE source = ? AND finished_at IS NOT NULL ORDER BY run_id DESC LIMIT 1",
+            [table.table],
+        ).fetchone()
+        mode = "full" if full or previous is None else "incremental"
+        key = quote_identifier(table.key)
+        watermark_from = previous[2] if mode == "incremental" else None
+        filters, parameters = self._run_filters(table, mode, previous[1] if previous else None, watermark_from, None)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        watermark = f", CAST(max({quote_identifier(table.watermark)}) AS VARCHAR)" if table.watermark else ", NULL"
+        key_lower, key_upper, watermark_to = self.execute(
+            f"SELECT min({key}), max({key}){watermark} FROM {self._source(table)} {where}", parameters
+        ).fetchone()
+        if key_lower is None:
+            return None
+        if mode == "incremental" and not table.watermark:
+            watermark_to = None
+        run = {
+            "run_id": (previous[0] if previous else 0) + 1,
+            "mode": mode,
+            "key_lower": key_lower,
+            "key_upper": key_upper,
+            "watermark_from": watermark_from,
+            "watermark_to": watermark_to or watermark_from,
+            "slices": max(1, min(table.slices, key_upper - key_lower + 1)),
+        }
+        self.duckdb_connection.begin()
+        try:
+            if abandon is not None:
+                for state_table in (self.runs_table, self.slices_table):
+                    self.execute(f"DELETE FROM {state_table} WHERE source = ? AND run_id = ?", [table.table, abandon])
+            self._prepare_target(table, mode)
+            self.execute(
+                f"INSERT INTO {self.runs_table} VALUES (?, ?, ?, ?, ?, ?, ?, ?, now(), NULL)",
+                [table.table, run["run_id"], mode, key_lower, key_upper, run["watermark_from"], run["watermark_to"], run["slices"]],
+            )
+            self.duckdb_connection.commit()
+        except duckdb.Error:
+            self._rollback(self.duckdb_connection)
+            raise
+        if table.target_file_size:
+            self._set_target_file_size(table)
+        logger.info(f"planned {mode} backfill run {run['run_id']} of {table.table}: keys {key_lower}..{key_upper} in {run['slices']} slices")
+        return run
+
+    def _prepare_target(self, table: BackfillCnn, mode: str) -> None:
+        target = self._target(table)
+        self.execute(f"CREATE TABLE IF NOT EXISTS {target} AS SELECT {self._columns(table)} FROM {self._source(table)} LIMIT 0;")
+        if mode == "full":
+            self.execute(f"DELETE FROM {target};")
+
+    def _set_target_file_size(self, table: BackfillCnn) -> None:
+        target = self._target(table)
+        try:
+            self.execute(
+                f"CALL {self.DEST.catalog.lake_alias}.set_option('target_file_size', ?, table_name => ?)",
+                [table.target_file_size, target],
+            )
+        except duckdb.Error as fail:
+            logger.warning(f"cannot set target_file_size of {target}: {fail}")
+
+    def _columns(self, table: BackfillCnn) -> str:
+        return ", ".join(quote_identifier(column) for column in table.columns) if table.columns else "*"
+
+    def _run_filters(self, table: BackfillCnn, mode: str, key_floor, watermark_from, watermark_to) -> tuple[list, list]:
+        """Row filter of a run: everything for full runs, changed (watermark) or new (key) rows for incremental ones."""
+        filters, parameters = [], []
+        if mode != "incremental":
+            return filters, parameters
+        if table.watermark:
+            watermark = quote_identifier(table.watermark)
+            if watermark_from is not None:
+                filters.append(f"{watermark} > ?")
+                parameters.append(watermark_from)
+            if watermark_to is not None:
+                filters.append(f"{watermark} <= ?")
+                parameters.append(watermark_to)
+        elif key_floor is not None:
+            filters.append(f"{quote_identifier(table.key)} > ?")
+            parameters.append(key_floor)
+        return filters, parameters
+
+    def _copy_slices(self, table: BackfillCnn, run: dict, workers: int) -> int:
+        done = {
+            slice_id for (slice_id,) in self.execute(
+                f"SELECT slice FROM {self.slices_table} WHERE source = ? AND run_id = ?", [table.table, run["run_id"]]
+            ).fetchall()
+        }
+        span = run["key_upper"] - run["key_lower"] + 1
+        bounds = [
+            (slice_id, run["key_lower"] + span * slice_id // run["slices"], run["key_lower"] + span * (slice_id + 1) // run["slices"])
+            for slice_id in range(run["slices"])
+            if slice_id not in done
+        ]
+        copied = 0
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="backfill") as pool:
+            futures = [pool.submit(self._copy_slice, table, run, *bound) for bound in bounds]
+            for future in as_completed(futures):
+                copied += future.result()
+        return copied
+
+    def _copy_slice(self, table: BackfillCnn, run: dict, slice_id: int, lower: int, upper: int) -> int:
+        """Copy keys [lower, upper) of a run and record the slice, atomically."""
+        started = time.perf_counter()
+        cursor = self.cursor()
+        self.execute(f"use {self.DEST.catalog.lake_alias};", cursor=cursor)
+        key = quote_identifier(table.key)
+        target = self._target(table)
+        # the slice range already lies above the previous key maximum of key-only incremental runs
+        filters, parameters = self._run_filters(table, run["mode"], None, run["watermark_from"], run["watermark_to"])
+        filters = [f"{key} >= ?", f"{key} < ?"] + filters
+        parameters = [lower, upper] + parameters
+        select = f"SELECT {self._columns(table)} FROM {self._source(table)} WHERE {' AND '.join(filters)}"
+        cursor.begin()
+        try:
+            if run["mode"] == "incremental" and table.watermark:
+                # changed rows replace their previous version in the lake
+                self.execute(f"CREATE OR REPLACE TEMP TABLE backfill_slice_{slice_id} AS {select}", parameters, cursor=cursor)
+                self.execute(
+                    f"DELETE FROM {target} WHERE {key} >= ? AND {key} < ? AND {key} IN (SELECT {key} FROM backfill_slice_{slice_id})",
+                    [lower, upper],
+                    cursor=cursor,
+                )
+                rows = self.execute(
+                    f"INSERT INTO {target} BY NAME SELECT * FROM backfill_slice_{slice_id}", cursor=cursor
+                ).fetchone()[0]
+                self.execute(f"DROP TABLE backfill_slice_{slice_id}", cursor=cursor)
+            else:
+                rows = self.execute(f"INSERT INTO {target} BY NAME {select}", parameters, cursor=cursor).fetchone()[0]
+            self.execute(
+                f"INSERT INTO {self.slices_table} VALUES (?, ?, ?, ?, now())",
+                [table.table, run["run_id"], slice_id, rows],
+                cursor=cursor,
+            )
+            cursor.commit()
+        except duckdb.Error as fail:
+            logger.error(f"backfill slice {slice_id} ({lower}..{upper}) of {table.table} failed: {fail}")
+            self._rollback(cursor)
+            raise
+        finally:
+            cursor.close()
+        BACKFILL_ROWS.inc(rows, table=table.table)
+        logger.debug(f"backfill slice {slice_id} of {table.table}: {rows} rows in {time.perf_counter() - started:.2f}s")
+        return rows
@@ -1,35 +1,224 @@
+import fnmatch
+import hashlib
+import os
+import re
 import sys
+import threading
 import boto3
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
 import duckdb
 import psycopg2
-from typing import List, Optional
+from typing import Any, Iterator, List, Optional
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from botocore.exceptions import ClientError, ConnectTimeoutError
-from lake.util.conf_loader import Configs
+from lake.util.conf_loader import Configs, ResultCacheCnn, StorageCnn
 import time
 from lake.util.logger import logger
-from duckdb import CatalogException
+from lake.util.metrics import registry
+from lake.util.object_cache import ObjectCache
+from lake.util.result_cache import ResultCache
 from typing import Literal, cast,Union
+
+QUERY_SECONDS = registry.histogram(
+    "lake_query_duration_seconds", "DuckDB statement execution time by statement kind", ("statement",)
+)
+STATEMENT_KINDS = {"select", "with", "insert", "delete", "update", "create", "alter", "drop", "attach", "copy", "call", "use", "describe", "show"}
+
+
+CHANGE_TYPES = ("insert", "delete", "update_preimage", "update_postimage")
+STREAM_BATCH_ROWS = 100_000
+EXPORT_FORMATS = ("parquet", "csv")
+
+S3_LITERAL = re.compile(r"'s3://([^/']+)/([^']*)'")
+READER_CALL = re.compile(r"\bread_\w+\s*\(\s*$", re.IGNORECASE)
+TABLE_REFERENCE = re.compile(r"\b(from|join)\s*$", re.IGNORECASE)
+SQL_TOKENS = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|\s+")
+SQL_NAMES = re.compile(r"'(?:[^']|'')*'|\"((?:[^\"]|\"\")*)\"|([A-Za-z_][\w$]*)")
+
+
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace outside quoted literals and drop trailing semicolons."""
+    return SQL_TOKENS.sub(lambda match: match.group(1) or " ", query).strip().rstrip(";").strip()
+
+
+def sql_names(query: str) -> set[str]:
+    """Lower-cased identifiers (and keywords) of a query, string literals skipped."""
+    names = set()
+    for match in SQL_NAMES.finditer(query):
+        quoted, bare = match.groups()
+        if quoted is not None:
+            names.add(quoted.replace('""', '"').lower())
+        elif bare is not None:
+            names.add(bare.lower())
+    return names
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def statement_kind(query: str) -> str:
+    words = query.lstrip(" \n\t(").split(None, 1)
+    kind = words[0].lower() if words else ""
+    return kind if kind in STATEMENT_KINDS else "other"
+
+
+class LakeSession:
+    """
+    Process-wide DuckDB connections keyed by config file. The first DuckLakeManager built
+    from a config attaches secrets, sources and the DuckLake catalog on the root connection;
+    every later one (pages, Panel sessions, the Kafka connector) only takes a cursor on it,
+    sharing attached catalogs and a single buffer pool.
+    """
+    _roots: dict[str, duckdb.DuckDBPyConnection] = {}
+    _caches: dict[str, ResultCache] = {}
+    _object_caches: dict[str, ObjectCache] = {}
+    _s3_clients: dict[tuple[str, str], object] = {}
+    lock = threading.RLock()
+
+    @classmethod
+    def get(cls, config_path: str) -> Optional[duckdb.DuckDBPyConnection]:
+        return cls._roots.get(os.path.abspath(config_path))
+
+    @classmethod
+    def register(cls, config_path: str, connection: duckdb.DuckDBPyConnection) -> None:
+        cls._roots[os.path.abspath(config_path)] = connection
+
+    @classmethod
+    def result_cache(cls, config_path: str, settings: ResultCacheCnn) -> ResultCache:
+        with cls.lock:
+            key = os.path.abspath(config_path)
+            if key not in cls._caches:
+                cls._caches[key] = ResultCache(settings.max_bytes, settings.spill_directory, settings.spill_max_bytes)
+            return cls._caches[key]
+
+    @classmethod
+    def object_cache(cls, storage: StorageCnn) -> Optional[ObjectCache]:
+        if not storage.cache_directory:
+            return None
+        with cls.lock:
+            key = os.path.abspath(storage.cache_directory)
+            if key not in cls._object_caches:
+                cls._object_caches[key] = ObjectCache(key, storage.cache_max_bytes)
+            return cls._object_caches[key]
+
+    @classmethod
+    def s3_client(cls, storage: StorageCnn):
+        with cls.lock:
+            key = (storage.get_address, storage.access_key.get_secret_value())
+            if key not in cls._s3_clients:
+                cls._s3_clients[key] = boto3.client(
+                    "s3",
+                    endpoint_url=storage.get_address,
+                    aws_access_key_id=storage.access_key.get_secret_value(),
+                    aws_secret_access_key=storage.secret.get_secret_value(),
+                )
+            return cls._s3_clients[key]
+
+    @classmethod
+    def close(cls, config_path: str) -> None:
+        connection = cls._roots.pop(os.path.abspath(config_path), None)
+        if connection is not None:
+            connection.close()
+
+
 class DuckLakeManager(Configs):
     pg_catalog:str = None
     s3_source_create_command: str = None
     healthy: bool = None
     duckdb_connection: duckdb.DuckDBPyConnection = None
+    config_path: str = None
+    _cached_queries: dict[tuple[str, str], tuple[str, Any, str]] = {}
     def __init__(self,config_path):
         super(DuckLakeManager,self).__init__(config_path)
-        self.duckdb_connection = duckdb.connect()
+        self.config_path = config_path
+        self._cached_queries: dict[tuple[str, str], tuple[str, Any, str]] = {}
+        with LakeSession.lock:
+            root = LakeSession.get(config_path)
+            if root is None:
+                root = self._open_session()
+                LakeSession.register(config_path, root)
+            else:
+                logger.debug(f"reusing attached ducklake session of {config_path}")
+        self.duckdb_connection = root.cursor()
+
+    def _open_session(self) -> duckdb.DuckDBPyConnection:
+        """Create the root connection of this config and attach everything on it."""
+        timings = {}
+        started = time.perf_counter()
+        self.duckdb_connection = duckdb.connect(config=self._engine_config())
+        timings["connect"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        installation_status = self.__install_duckdb_extensions()
+        timings["extensions"] = time.perf_counter() - started
+        if installation_status is not None:
+            sys.exit(1)
+        # extension settings, only known once the extensions are loaded
+        if self.DEST.engine.parquet_metadata_cache:
+            self.execute("SET GLOBAL parquet_metadata_cache = true;")
+        if self.DEST.engine.http_metadata_cache:
+            self.execute("SET GLOBAL enable_http_metadata_cache = true;")
+
+        started = time.perf_counter()
+        self._register_sources()
         try:
-            self._attach()
-            result = self.duckdb_connection.execute("SHOW TABLES").fetchall()
-            if len(result) == 0:
-               raise CatalogException
-            logger.info(f"attached existing ducklake {self.DEST.catalog.lake_alias} with {len(result)} tables")
-        except CatalogException:
+            self._attach_lake()
+            tables = self._count_lake_tables()
+        except duckdb.Error as fail:
+            logger.warning(f"cannot attach {self.DEST.catalog.lake_alias} ({fail}), asserting backing services...")
+            tables = None
+        timings["attach"] = time.perf_counter() - started
+        if not tables:
+            # a fresh (or unreachable) lake: make sure the bucket and catalog database exist
             logger.warning(f"catalog Not found! (Creating {self.DEST.catalog.lake_alias}...)")
+            started = time.perf_counter()
             self._connectivity_assessment()
-            installation_status = self.__install_duckdb_extensions()
-            if installation_status is not None:
-                sys.exit(1)
+            timings["connectivity"] = time.perf_counter() - started
+            if tables is None:
+                # only the lake itself is retried: secrets and sources are already registered
+                started = time.perf_counter()
+                self._attach_lake()
+                timings["attach (retry)"] = time.perf_counter() - started
+        else:
+            logger.info(f"attached existing ducklake {self.DEST.catalog.lake_alias} with {tables} tables")
+        logger.info(
+            "ducklake startup: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in timings.items())
+            + f" (total {sum(timings.values()):.2f}s)"
+        )
+        return self.duckdb_connection
+
+    def _engine_config(self) -> dict:
+        engine = self.DEST.engine
+        config = {
+            "memory_limit": engine.memory_limit,
+            "threads": engine.threads,
+            "extension_directory": engine.extension_directory,
+        }
+        return {key: value for key, value in config.items() if value is not None}
+
+    def _count_lake_tables(self) -> int:
+        return self.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE database_name = ?", [self.DEST.catalog.lake_alias]
+        ).fetchone()[0]
+
+    @staticmethod
+    def _rollback(cursor: duckdb.DuckDBPyConnection) -> None:
+        try:
+            cursor.rollback()
+        except duckdb.TransactionException:
+            pass  # no transaction was open
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        """Return a new cursor on the shared lake session, for use from another thread."""
+        return self.duckdb_connection.cursor()
     
     def _get_dest_storage_secret(self):
         try:
@@ -89,64 +278,89 @@ class DuckLakeManager(Configs):
             logger.critical(f"cannot register {self.SRC.storage.lake_alias} {fail}")
             return 'select 1;'
 
-    def _attach(self):
-        
-        self.duckdb_connection.execute(self._get_dest_storage_secret())
-        
-        
+    def execute(self, query: str, parameters=None, cursor: duckdb.DuckDBPyConnection = None) -> duckdb.DuckDBPyConnection:
+        """Execute a statement on the lake connection (or the given cursor) and record its latency."""
+        cursor = cursor or self.duckdb_connection
+        started = time.perf_counter()
+        try:
+            return cursor.execute(query, parameters)
+        finally:
+            QUERY_SECONDS.observe(time.perf_counter() - started, statement=statement_kind(query))
+
+    def _register_sources(self):
+        """Create the storage secrets and attach the configured sources (once per session)."""
+        self.execute(self._get_dest_storage_secret())
         if self.SRC.storage:
             logger.info(f"registering s3 source {self.SRC.storage.lake_alias}")
-            self.duckdb_connection.execute(self._get_src_s3_secret())
+            self.execute(self._get_src_s3_secret())
         if self.SRC.postgres:
             logger.info(f"registering postgres source {self.SRC.postgres.lake_alias}")
-            self.duckdb_connection.execute(self._get_src_pg_secret())
+            self.execute(self._get_src_pg_secret())
             attach_src_pg_command = f"ATTACH 'dbname={self.SRC.postgres.database}' AS {self.SRC.postgres.lake_alias} (TYPE postgres, SECRET {self.SRC.postgres.lake_alias}_secret);"
-            self.duckdb_connection.execute(attach_src_pg_command)
+            self.execute(attach_src_pg_command)
+
+    def _attach_lake(self):
+        """Attach the ducklake catalog; safe to call again after a failed attempt."""
         logger.info(f"registering core 'DATA LAKE' as {self.DEST.catalog.lake_alias}")
-        attach_lake_command = f"ATTACH 'ducklake:{self._get_dest_catalog_definition()}' AS {self.DEST.catalog.lake_alias} (DATA_PATH 's3://{self.DEST.storage.scope}');"
-        self.duckdb_connection.execute(attach_lake_command)
-        
+        attach_lake_command = f"ATTACH IF NOT EXISTS 'ducklake:{self._get_dest_catalog_definition()}' AS {self.DEST.catalog.lake_alias} (DATA_PATH 's3://{self.DEST.storage.scope}');"
+        self.execute(attach_lake_command)
+
 
+    def _with_backoff(self, check, name: str):
+        """Run a connectivity check, retrying with bounded exponential backoff."""
+        engine = self.DEST.engine
+        delay = engine.retry_delay
+        for attempt in range(1, engine.retries + 1):
+            try:
+                return check()
+            except (ClientError, ConnectTimeoutError, psycopg2.Error) as fail:
+                if attempt == engine.retries:
+                    logger.critical(f"{name} is unreachable after {attempt} attempts: {fail}")
+                    raise
+                logger.error(f"{name} check failed (attempt {attempt}/{engine.retries}, retrying in {delay:.1f}s): {fail}")
+                time.sleep(delay)
+                delay = min(delay * 2, engine.max_retry_delay)
 
     def _connectivity_assessment(self):
+        """Assert (and create when missing) the lake bucket and catalog database, concurrently."""
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="connectivity") as pool:
+            checks = [
+                pool.submit(self._with_backoff, self._assert_storage, f"s3://{self.DEST.storage.scope}"),
+                pool.submit(self._with_backoff, self._assert_catalog, f"catalog {self.DEST.catalog.host}:{self.DEST.catalog.port}"),
+            ]
+            try:
+                for check in checks:
+                    check.result()
+            except (ClientError, ConnectTimeoutError, psycopg2.Error):
+                sys.exit(1)
+
+    def _assert_storage(self):
         s3_object = self.DEST.storage
-        pg_object = self.DEST.catalog
-        try:
-            logger.info(f"checking connectivity for source s3")
-            s3_client = boto3.client(
-                "s3",
-                endpoint_url=s3_object.get_address,
-                aws_access_key_id=s3_object.access_key.get_secret_value(),
-                aws_secret_access_key=s3_object.secret.get_secret_value()
-            )
-        except ClientError as e:
-            logger.error(f'failed to assert connection to s3://{s3_object.scope}| {e}')
-            time.sleep(3)
-            self._connectivity_assessment()
+        logger.info(f"checking connectivity for source s3")
+        s3_client = LakeSession.s3_client(s3_object)
         try:
             bucket_data = s3_client.head_bucket(Bucket=s3_object.scope)
             assert bucket_data['ResponseMetadata']['HTTPStatusCode'] == 200
             logger.debug(f'bucket {s3_object.scope} already exist (no action needed)')
         except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchBucket"):
+                raise
             logger.error(f'cannot find bucket with name {s3_object.scope} (creating...)')
-            try:
-                s3_client.create_bucket(Bucket=s3_object.scope)
-            except ClientError as e:
-                logger.error(f'there is a problem with defined bucket name or \
-                             client doesnt seem to have right permissions to create new bucket\
-                                -> {s3_object.scope} {e}')
-                time.sleep(3)
-                self._connectivity_assessment()
+            s3_client.create_bucket(Bucket=s3_object.scope)
         logger.info("s3 connectivity test successfull")
+
+    def _assert_catalog(self):
+        pg_object = self.DEST.catalog
         pg_conn = None
         try:
-            logger.info(f"checking connectivity for catalog data-store({pg_object})")
+            logger.info(f"checking connectivity for catalog data-store({pg_object.host}:{pg_object.port})")
             pg_conn = psycopg2.connect(
                 host=pg_object.host,
                 port=pg_object.port,
                 user=pg_object.username.get_secret_value(),
                 password=pg_object.password.get_secret_value(),
                 dbname='postgres',
+                connect_timeout=10,
             )
             pg_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
             with pg_conn.cursor() as cursor:
@@ -163,10 +377,6 @@ class DuckLakeManager(Configs):
                     logger.info(
                         f"database '{db_name}' already exists. No action needed."
                     )
-        except psycopg2.Error as e:
-            logger.error(f"postgreSQL error: {e}")
-            time.sleep(3)
-            self._connectivity_assessment()
         finally:
             if pg_conn:
                 pg_conn.close()
@@ -175,11 +385,19 @@ class DuckLakeManager(Configs):
     def __install_duckdb_extensions(
         self, extensions: List = ["ducklake", "postgres", "httpfs","excel"]
     ) -> Optional[Exception]:
+        # only download what the extension directory doesn't already hold
+        installed = {
+            name for (name,) in self.duckdb_connection.execute(
+                "SELECT extension_name FROM duckdb_extensions() WHERE installed"
+            ).fetchall()
+        }
         for extension_name in extensions:
             try:
-                self.duckdb_connection.sql(f"INSTALL {extension_name};")
+                if extension_name not in installed:
+                    self.duckdb_connection.sql(f"INSTALL {extension_name};")
+                    logger.info(f"{extension_name} installed successfully.")
                 self.duckdb_connection.sql(f"LOAD {extension_name};")
-                logger.info(f"{extension_name} installed and loaded successfully.")
+                logger.debug(f"{extension_name} loaded successfully.")
             except duckdb.HTTPException as e:
                 logger.error(
                     f"extension {extension_name} not found or you might have connectivity issues:\n{e}"
@@ -191,43 +409,257 @@ class DuckLakeManager(Configs):
                 )
                 return e
 
-    def retrive_snapshot(self,commit_type:Literal['tables_inserted_into','tables_deleted_from'],table_name:str):
-        """Use time travel to investigate what happened."""
-        print("Investigation: What Happened?")
-
-        snapshots = self.duckdb_connection.execute(
-            """
-            SELECT snapshot_id, snapshot_time, changes
-            FROM ducklake_snapshots('lake')
-            ORDER BY snapshot_id DESC
-            LIMIT 10;
+    def current_snapshot_id(self) -> Optional[int]:
+        """Return the latest DuckLake snapshot id of the lake (None when the catalog cannot be read)."""
+        try:
+            return self.execute(
+                f"SELECT max(snapshot_id) FROM ducklake_snapshots('{self.DEST.catalog.lake_alias}')"
+            ).fetchone()[0]
+        except duckdb.Error as fail:
+            logger.debug(f"cannot read current snapshot of {self.DEST.catalog.lake_alias}: {fail}")
+            return None
+
+    def cached_query(self, query: str, parameters=None) -> pa.Table:
+        """
+        Run a read query through the process-wide result cache.
+        Results are keyed by the normalized SQL, its parameters, the current DuckLake snapshot
+        (only when the query references the lake) and the ETags of every s3:// object the query
+        reads, so they are recomputed only when the data they were computed from changed.
+        """
+        cache = LakeSession.result_cache(self.config_path, self.DEST.result_cache)
+        sources = self._query_sources(query)
+        key = self._result_key(query, parameters, sources)
+        self._cached_queries[(normalize_sql(query), repr(parameters))] = (query, parameters, key)
+        table = cache.get(key)
+        if table is None:
+            table = self.execute(self.localize(query, sources), parameters).fetch_arrow_table()
+            cache.put(key, table)
+        return table
+
+    def cached_queries_changed(self) -> Optional[bool]:
+        """
+        Whether the data behind any query run through cached_query() (since the last
+        reset_cached_queries()) changed, by comparing its result-cache key then and now.
+        None when no query was run through the cache, i.e. it cannot be told.
+        """
+        if not self._cached_queries:
+            return None
+        return any(self._result_key(query, parameters) != key for query, parameters, key in self._cached_queries.values())
+
+    def reset_cached_queries(self) -> None:
+        self._cached_queries.clear()
+
+    def _query_sources(self, query: str) -> dict[tuple[str, str], list[tuple[str, str]]]:
+        """(key, ETag) of the objects behind every s3:// literal of a query."""
+        return {(bucket, pattern): self._source_etags(bucket, pattern) for bucket, pattern in set(S3_LITERAL.findall(query))}
+
+    def _result_key(self, query: str, parameters=None, sources: dict = None) -> str:
+        sources = self._query_sources(query) if sources is None else sources
+        digest = hashlib.sha256(normalize_sql(query).encode())
+        digest.update(repr(parameters).encode())
+        # a query over s3 objects alone stays cached across lake commits, its ETags are its version
+        digest.update(repr(self.current_snapshot_id() if self._reads_lake(query) else None).encode())
+        for bucket, pattern in S3_LITERAL.findall(query):
+            digest.update(repr(sources[(bucket, pattern)]).encode())
+        return digest.hexdigest()
+
+    def _reads_lake(self, query: str) -> bool:
+        """
+        Whether a query may read lake data: it names the lake catalog, a ducklake_* function or a
+        table/view of the lake. Errs on the side of True when the lake's tables cannot be listed.
+        """
+        names = sql_names(query)
+        alias = self.DEST.catalog.lake_alias.lower()
+        if alias in names or any(name.startswith("ducklake_") for name in names):
+            return True
+        try:
+            tables = self.execute(
+                "SELECT table_name FROM duckdb_tables() WHERE database_name = ? "
+                "UNION SELECT view_name FROM duckdb_views() WHERE database_name = ?",
+                [self.DEST.catalog.lake_alias, self.DEST.catalog.lake_alias],
+            ).fetchall()
+        except duckdb.Error:
+            return True
+        return any(table.lower() in names for table, in tables)
+
+    def localize(self, query: str, sources: dict = None) -> str:
+        """
+        Point the s3:// literals of a query at local copies when the storage they belong to has a
+        cache_directory. Only literals that are read as files are replaced: the path argument of a
+        read_*() call, or (exact keys only) a file scanned directly in FROM/JOIN. Other literals, e.g.
+        compared against a column, and anything that cannot be cached are left untouched.
+        """
+        def replace(match: re.Match) -> str:
+            bucket, pattern = match.group(1), match.group(2)
+            storage = self._storage_for(bucket)
+            cache = LakeSession.object_cache(storage)
+            is_glob = any(char in pattern for char in "*?[")
+            before = query[:match.start()]
+            # a list of files is only valid as a reader argument, a single file also as a table reference
+            read = READER_CALL.search(before) or (not is_glob and TABLE_REFERENCE.search(before))
+            if cache is None or not read:
+                return match.group(0)
+            objects = sources[(bucket, pattern)] if sources is not None else self._source_etags(bucket, pattern)
+            if not objects:
+                return match.group(0)
+            client = LakeSession.s3_client(storage)
+            try:
+                paths = [cache.get(client, bucket, key, etag) for key, etag in objects]
+            except (ClientError, OSError) as fail:
+                logger.warning(f"cannot cache s3://{bucket}/{pattern} locally, reading it remotely: {fail}")
+                return match.group(0)
+            if is_glob:
+                return "[" + ", ".join(sql_literal(path) for path in paths) + "]"
+            return sql_literal(paths[0])
+        return S3_LITERAL.sub(replace, query)
+
+    def _storage_for(self, bucket: str) -> StorageCnn:
+        return self.DEST.storage if bucket == self.DEST.storage.scope else (self.SRC.storage or self.DEST.storage)
+
+    def _source_etags(self, bucket: str, pattern: str) -> list[tuple[str, str]]:
+        """Return (key, ETag) of the objects an s3:// path or glob resolves to."""
+        client = LakeSession.s3_client(self._storage_for(bucket))
+        try:
+            if not any(char in pattern for char in "*?["):
+                return [(pattern, client.head_object(Bucket=bucket, Key=pattern)["ETag"])]
+            prefix = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+            etags = []
+            for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+                etags.extend(
+                    (item["Key"], item["ETag"]) for item in page.get("Contents", []) if fnmatch.fnmatchcase(item["Key"], pattern)
+                )
+            return etags
+        except ClientError as fail:
+            logger.debug(f"cannot resolve ETags of s3://{bucket}/{pattern}: {fail}")
+            return []
+
+    def record_batch_reader(self, query: str, parameters=None, batch_size: int = STREAM_BATCH_ROWS) -> pa.RecordBatchReader:
+        """Run a read query on a dedicated cursor and return a reader over batches of at most `batch_size` rows."""
+        return self.execute(self.localize(query), parameters, cursor=self._lake_cursor()).fetch_record_batch(batch_size)
+
+    def _lake_cursor(self) -> duckdb.DuckDBPyConnection:
+        """A dedicated cursor (independent of other statements on this manager) resolving unqualified names in the lake."""
+        cursor = self.cursor()
+        self.execute(f"USE {self.DEST.catalog.lake_alias};", cursor=cursor)
+        return cursor
+
+    def stream_query(self, query: str, parameters=None, batch_size: int = STREAM_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+        """Yield the result of a read query as Arrow record batches, never holding more than one batch in memory."""
+        yield from self.record_batch_reader(query, parameters, batch_size)
+
+    def export(
+        self,
+        query: str,
+        destination: str,
+        file_format: Optional[Literal["parquet", "csv"]] = None,
+        parameters=None,
+        batch_size: int = STREAM_BATCH_ROWS,
+    ) -> int:
+        """
+        Write the result of a read query to a Parquet/CSV file in constant memory and return the number of rows.
+        Local files are written batch by batch with pyarrow; s3:// destinations are written by DuckDB itself
+        (COPY ... TO) with the secrets of the lake session. The format defaults to the destination's suffix.
+        """
+        file_format = file_format or ("csv" if destination.lower().endswith(".csv") else "parquet")
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"unsupported export format {file_format} (expected one of {EXPORT_FORMATS})")
+        started = time.perf_counter()
+        if destination.startswith("s3://"):
+            rows = self.execute(
+                f"COPY ({normalize_sql(query)}) TO {sql_literal(destination)} (FORMAT {file_format})", parameters, cursor=self._lake_cursor()
+            ).fetchone()[0]
+        else:
+            rows = 0
+            reader = self.record_batch_reader(query, parameters, batch_size)
+            os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+            if file_format == "csv":
+                writer = pa_csv.CSVWriter(destination, reader.schema)
+            else:
+                writer = pq.ParquetWriter(destination, reader.schema)
+            with writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+        logger.info(f"exported {rows} rows to {destination} ({file_format}) in {time.perf_counter() - started:.2f}s")
+        return rows
+
+    def snapshots(self, since=None, until=None, commit_type: Optional[str] = None) -> list[tuple]:
+        """
+        List (snapshot_id, snapshot_time, changes) of the lake, oldest first.
+        `since`/`until` bound snapshot_time (datetime or timestamp string), `commit_type` keeps only
+        snapshots whose changes contain that key (e.g. tables_inserted_into, tables_deleted_from).
         """
+        filters, parameters = self._snapshot_filters(since, until)
+        if commit_type:
+            filters.append("list_contains(map_keys(changes), ?)")
+            parameters.append(commit_type)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        return self.execute(
+            f"SELECT snapshot_id, snapshot_time, changes FROM ducklake_snapshots('{self.DEST.catalog.lake_alias}') {where} ORDER BY snapshot_id",
+            parameters,
         ).fetchall()
-        
-        logger.info("\n🔍 Analyzing recent changes...")
-
-        # Find the deletion snapshot
-        deletion_snapshot = None
-        previous_snapshot = None
-        # tables_inserted_into
-
-        for i, (snap_id, snap_time, changes) in enumerate(snapshots):
-            print(snap_id,snap_time,list(changes.keys()))
-            if commit_type in list(changes.keys()):
-                target_snapshot = snap_id
-                if i + 1 < len(snapshots):
-                    previous_snapshot = snapshots[i + 1][0]
-                break
-
-        if target_snapshot:
-            logger.warning(f"\n⚠️  Found deletion in snapshot {deletion_snapshot}")
-            logger.info(f"   Previous good snapshot: {previous_snapshot}")
-            if previous_snapshot:
-                logger.info("\n📊 Data that was deleted:")
-                prev_data_state = self.duckdb_connection.execute(
-                    f"""
-                    SELECT * FROM {table_name} AT (VERSION => {previous_snapshot})
-                """
-                ).fetchdf()
-                print(prev_data_state)
-        return prev_data_state
\ No newline at end of file
+
+    def snapshot_diff(
+        self,
+        table_name: str,
+        start_snapshot: Optional[int] = None,
+        end_snapshot: Optional[int] = None,
+        since=None,
+        until=None,
+        change_types: Optional[List[str]] = None,
+        batch_size: int = STREAM_BATCH_ROWS,
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Stream the rows of `table_name` that changed between two snapshots (both inclusive) as Arrow record batches.
+        Every row carries snapshot_id, rowid and change_type (insert, delete, update_preimage, update_postimage)
+        next to the table columns; only changed rows are read, through DuckLake's table_changes().
+        Missing snapshot ids are derived from `since`/`until` (first/last snapshot committed inside
+        the time range), defaulting to the whole history.
+        """
+        unknown = set(change_types or []) - set(CHANGE_TYPES)
+        if unknown:
+            raise ValueError(f"unknown change types {sorted(unknown)} (expected one of {CHANGE_TYPES})")
+        if start_snapshot is None or end_snapshot is None:
+            filters, parameters = self._snapshot_filters(since, until)
+            where = f"WHERE {' AND '.join(filters)}" if filters else ""
+            first, last = self.execute(
+                f"SELECT min(snapshot_id), max(snapshot_id) FROM ducklake_snapshots('{self.DEST.catalog.lake_alias}') {where}",
+                parameters,
+            ).fetchone()
+            start_snapshot = first if start_snapshot is None else start_snapshot
+            end_snapshot = last if end_snapshot is None else end_snapshot
+        if start_snapshot is None or end_snapshot is None or start_snapshot > end_snapshot:
+            logger.info(f"no snapshots of {table_name} in the requested range")
+            return
+        query = f"SELECT * FROM {self.DEST.catalog.lake_alias}.table_changes({sql_literal(table_name)}, {int(start_snapshot)}, {int(end_snapshot)})"
+        parameters = None
+        if change_types:
+            query += f" WHERE change_type IN ({', '.join('?' for _ in change_types)})"
+            parameters = list(change_types)
+        logger.info(f"streaming changes of {table_name} between snapshots {start_snapshot} and {end_snapshot}")
+        yield from self.stream_query(query, parameters, batch_size)
+
+    @staticmethod
+    def _snapshot_filters(since=None, until=None) -> tuple[list, list]:
+        filters, parameters = [], []
+        if since is not None:
+            filters.append("snapshot_time >= CAST(? AS TIMESTAMPTZ)")
+            parameters.append(since)
+        if until is not None:
+            filters.append("snapshot_time <= CAST(? AS TIMESTAMPTZ)")
+            parameters.append(until)
+        return filters, parameters
+
+    def retrive_snapshot(self,commit_type:Literal['tables_inserted_into','tables_deleted_from'],table_name:str):
+        """Use time travel to investigate what happened (only the rows touched by the latest matching commit)."""
+        matches = self.snapshots(commit_type=commit_type)
+        if not matches:
+            logger.warning(f"no snapshot with {commit_type} found")
+            return None
+        snapshot_id, snapshot_time, _ = matches[-1]
+        logger.info(f"found {commit_type} in snapshot {snapshot_id} ({snapshot_time})")
+        change_type = "delete" if commit_type == "tables_deleted_from" else "insert"
+        batches = list(self.snapshot_diff(table_name, snapshot_id, snapshot_id, change_types=[change_type]))
+        if not batches:
+            return None
+        return pa.Table.from_batches(batches).to_pandas()
@@ -0,0 +1,188 @@
+import fnmatch
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+import duckdb
+from lake.connector.core import DuckLakeManager, LakeSession, quote_identifier, sql_literal
+from lake.util.conf_loader import FileIngestCnn
+from lake.util.logger import logger
+from lake.util.metrics import registry
+
+INGESTED_FILES = registry.counter("lake_ingested_files_total", "Objects of SRC.storage loaded into the lake", ("table",))
+INGESTED_FILE_BYTES = registry.counter("lake_ingested_file_bytes_total", "Bytes of SRC.storage objects loaded into the lake", ("table",))
+SUFFIX_FORMATS = {".parquet": "parquet", ".csv": "csv", ".csv.gz": "csv", ".xlsx": "xlsx"}
+
+
+class Connector(DuckLakeManager):
+    """
+    Incremental bulk load of SRC.storage objects (SRC.files) into lake tables.
+    Objects under a prefix are listed with boto3 and compared, by key and ETag, with a manifest of what was
+    already loaded; new or overwritten objects are read in batches of `batch_files` (one read_parquet/read_csv
+    call over the whole batch) by parallel workers. A batch and its manifest rows commit in one lake transaction.
+    """
+    manifest_table: str = "file_manifest"
+
+    def __init__(self, config_path):
+        super(Connector, self).__init__(config_path)
+        if self.SRC.storage is None:
+            raise ValueError("ingest-files needs SRC.storage to be configured")
+        self.execute(f"use {self.DEST.catalog.lake_alias};")
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.manifest_table} "
+            "(target VARCHAR, bucket VARCHAR, key VARCHAR, etag VARCHAR, size BIGINT, ingested_at TIMESTAMP WITH TIME ZONE);"
+        )
+
+    def ingest(self, tables: list[str] | None = None, workers: int = 4) -> None:
+        """Load every new or changed object of each SRC.files entry (or only those targeting `tables`)."""
+        for source in self.SRC.files:
+            if tables and source.table not in tables:
+                continue
+            started = time.perf_counter()
+            pending = self.pending_objects(source)
+            if not pending:
+                logger.info(f"no new objects for {source.table} under s3://{self.SRC.storage.scope}/{source.prefix}")
+                continue
+            groups = self._group_by_format(source, pending)
+            # one reader per batch: objects of different formats never share a read_parquet/read_csv call
+            batches = [
+                (file_format, items[index:index + source.batch_files])
+                for file_format, items in groups.items()
+                for index in range(0, len(items), source.batch_files)
+            ]
+            if not batches:
+                continue
+            self._prepare_target(source, batches)
+            files, size = 0, 0
+            with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest-files") as pool:
+                futures = [pool.submit(self._load_batch, source, file_format, batch) for file_format, batch in batches]
+                for future in as_completed(futures):
+                    try:
+                        loaded = future.result()
+                    except duckdb.Error:
+                        continue
+                    files += len(loaded)
+                    size += sum(item["Size"] for item in loaded)
+            logger.info(
+                f"ingested {files}/{sum(len(items) for items in groups.values())} objects ({size / 1024 / 1024:.1f}MiB) into {source.table} "
+                f"in {len(batches)} batches, {time.perf_counter() - started:.2f}s"
+            )
+
+    def pending_objects(self, source: FileIngestCnn) -> list[dict]:
+        """List objects matching the source whose key/ETag pair is not in the manifest yet."""
+        bucket = self.SRC.storage.scope
+        loaded = set(
+            self.execute(
+                f"SELECT key, etag FROM {self.manifest_table} WHERE target = ? AND bucket = ?", [source.table, bucket]
+            ).fetchall()
+        )
+        client = LakeSession.s3_client(self.SRC.storage)
+        pending = []
+        for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=source.prefix):
+            for item in page.get("Contents", []):
+                name = item["Key"][len(source.prefix):].lstrip("/")
+                if fnmatch.fnmatchcase(name, source.pattern) and (item["Key"], item["ETag"]) not in loaded:
+                    pending.append(item)
+        return pending
+
+    def _url(self, item: dict) -> str:
+        return f"s3://{self.SRC.storage.scope}/{item['Key']}"
+
+    def _format(self, source: FileIngestCnn, key: str) -> Optional[str]:
+        if source.format:
+            return source.format
+        for suffix, file_format in SUFFIX_FORMATS.items():
+            if key.lower().endswith(suffix):
+                return file_format
+        return None
+
+    def _group_by_format(self, source: FileIngestCnn, pending: list[dict]) -> dict[str, list[dict]]:
+        """Split pending objects by reader; objects of unknown format (_SUCCESS markers, READMEs...) are skipped."""
+        groups, skipped = {}, []
+        for item in pending:
+            file_format = self._format(source, item["Key"])
+            if file_format is None:
+                skipped.append(item["Key"])
+            else:
+                groups.setdefault(file_format, []).append(item)
+        if skipped:
+            logger.warning(
+                f"skipping {len(skipped)} objects of unknown format for {source.table} ({skipped[0]}...), "
+                "narrow `pattern` or set `format` on its SRC.files entry"
+            )
+        return groups
+
+    def _select(self, source: FileIngestCnn, file_format: str, batch: list[dict]) -> str:
+        """One scan over a whole batch: read_parquet/read_csv take the file list, read_xlsx is unioned per file."""
+        urls = [self._url(item) for item in batch]
+        if file_format == "xlsx":
+            selects = []
+            for url in urls:
+                column = f", {sql_literal(url)} AS {quote_identifier(source.source_column)}" if source.source_column else ""
+                selects.append(f"SELECT *{column} FROM read_xlsx({sql_literal(url)})")
+            return " UNION ALL BY NAME ".join(selects)
+        reader = "read_parquet" if file_format == "parquet" else "read_csv"
+        files = "[" + ", ".join(sql_literal(url) for url in urls) + "]"
+        if source.source_column:
+            return (
+                f"SELECT * EXCLUDE (filename), filename AS {quote_identifier(source.source_column)} "
+                f"FROM {reader}({files}, union_by_name = true, filename = true)"
+            )
+        return f"SELECT * FROM {reader}({files}, union_by_name = true)"
+
+    def _prepare_target(self, source: FileIngestCnn, batches: list[tuple[str, list[dict]]]) -> None:
+        """
+        Create the target from the first object and add every column a later batch brings (as the kafka
+        connector widens its ingest tables), up-front, so that parallel batches only ever append by name.
+        """
+        file_format, batch = batches[0]
+        self.execute(f"CREATE TABLE IF NOT EXISTS {source.table} AS {self._select(source, file_format, batch[:1])} LIMIT 0;")
+        known = {
+            name
+            for (name,) in self.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_catalog = current_database() AND table_schema = current_schema() AND table_name = ?",
+                [source.table],
+            ).fetchall()
+        }
+        for file_format, batch in batches:
+            # DESCRIBE only reads footers (parquet) or sniffs a sample (csv), not the data
+            types = self.execute(
+                f"SELECT column_name, column_type FROM (DESCRIBE SELECT * FROM ({self._select(source, file_format, batch)}))"
+            ).fetchall()
+            missing = [f"{quote_identifier(name)} {column_type}" for name, column_type in types if name not in known]
+            for definition in missing:
+                self.execute(f"ALTER TABLE {source.table} ADD COLUMN {definition};")
+            if missing:
+                logger.warning(f"schema of {source.table} evolved, added columns: {missing}")
+                known.update(name for name, _ in types)
+
+    def _load_batch(self, source: FileIngestCnn, file_format: str, batch: list[dict]) -> list[dict]:
+        started = time.perf_counter()
+        bucket = self.SRC.storage.scope
+        cursor = self.cursor()
+        self.execute(f"use {self.DEST.catalog.lake_alias};", cursor=cursor)
+        cursor.begin()
+        try:
+            if source.source_column:
+                # overwritten objects replace the rows of their previous version
+                self.execute(
+                    f"DELETE FROM {source.table} WHERE {quote_identifier(source.source_column)} IN (SELECT unnest(?))",
+                    [[self._url(item) for item in batch]],
+                    cursor=cursor,
+                )
+            rows = self.execute(f"INSERT INTO {source.table} BY NAME {self._select(source, file_format, batch)}", cursor=cursor).fetchone()[0]
+            cursor.executemany(
+                f"INSERT INTO {self.manifest_table} VALUES (?, ?, ?, ?, ?, now())",
+                [[source.table, bucket, item["Key"], item["ETag"], item["Size"]] for item in batch],
+            )
+            cursor.commit()
+        except duckdb.Error as fail:
+            logger.error(f"failed to ingest {len(batch)} objects ({batch[0]['Key']}...) into {source.table}: {fail}")
+            self._rollback(cursor)
+            raise
+        finally:
+            cursor.close()
+        INGESTED_FILES.inc(len(batch), table=source.table)
+        INGESTED_FILE_BYTES.inc(sum(item["Size"] for item in batch), table=source.table)
+        logger.debug(f"ingested {len(batch)} objects ({rows} rows) into {source.table} in {time.perf_counter() - started:.2f}s")
+        return batch
@@ -1,18 +1,243 @@
-from lake.connector.core import DuckLakeManager
-from lake.util.logger import logger
+from lake.connector.core import DuckLakeManager, quote_identifier
+from lake.util.conf_loader import RouteCnn
+from lake.util.decoders import BatchDecoder, make_decoder, records_table, strings_for_null_columns
+from lake.util.logger import logger, LogSampler
+from lake.util.metrics import registry
 from duckdb import DuckDBPyConnection
-from confluent_kafka import Consumer,KafkaException,KafkaError
+from confluent_kafka import Consumer,KafkaException,KafkaError,TopicPartition,OFFSET_BEGINNING,TIMESTAMP_NOT_AVAILABLE
 from collections.abc import Generator
+from datetime import datetime, timezone
+import duckdb
+import fnmatch
 import json
+import re
+import threading
+import time
+from queue import Empty, Full, Queue
+import numpy as np
 import pandas as pd
-from typing import Optional
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
+import os
+import sys
+from typing import Any, Optional
+
+INGESTED_MESSAGES = registry.counter("lake_ingest_messages_total", "Messages written into the lake", ("table",))
+INGESTED_BYTES = registry.counter("lake_ingest_bytes_total", "In-memory bytes of batches written into the lake", ("table",))
+STAGE_SECONDS = registry.histogram("lake_ingest_stage_duration_seconds", "Time spent per ingest stage (poll, decode, insert, commit)", ("stage",))
+CONSUMER_LAG = registry.gauge("lake_consumer_lag_messages", "High watermark minus last committed offset", ("topic", "partition"))
+WRITE_QUEUE_DEPTH = registry.gauge("lake_ingest_queue_depth", "Decoded batches waiting for the ducklake writer")
+# optional per-message columns (stream.metadata_columns) and their types
+METADATA_FIELDS = {
+	"topic": pa.field("_kafka_topic", pa.string()),
+	"partition": pa.field("_kafka_partition", pa.int32()),
+	"offset": pa.field("_kafka_offset", pa.int64()),
+	"key": pa.field("_kafka_key", pa.string()),
+	"timestamp": pa.field("_kafka_timestamp", pa.timestamp("ms", tz="UTC")),
+}
+# a partition key is a column or one of DuckLake's time transforms over a column: day(event_time)
+PARTITION_KEY = re.compile(r"^\s*(?:(year|month|day|hour)\s*\(\s*([^()]+?)\s*\)|([^()]+?))\s*$", re.IGNORECASE)
+
+
+def frame_columns(frame: pa.Table | pd.DataFrame) -> list[str]:
+	return frame.column_names if isinstance(frame, pa.Table) else [str(name) for name in frame.columns]
+
+
+def frame_nbytes(frame: pa.Table | pd.DataFrame) -> int:
+	return frame.nbytes if isinstance(frame, pa.Table) else int(frame.memory_usage(index=False).sum())
+
+
+def merge_frames(frames: list[pa.Table | pd.DataFrame]) -> list[pa.Table | pd.DataFrame]:
+	"""Concatenate frames bound for the same table into one buffer when their schemas can be unified."""
+	if len(frames) < 2:
+		return frames
+	if all(isinstance(frame, pa.Table) for frame in frames):
+		try:
+			return [pa.concat_tables(frames, promote_options="permissive")]
+		except (pa.ArrowInvalid, pa.ArrowTypeError):
+			return frames
+	if all(isinstance(frame, pd.DataFrame) for frame in frames):
+		return [pd.concat(frames, ignore_index=True)]
+	return frames
+
+
+def message_metadata(msg, names: list[str]) -> dict[str, Any]:
+	"""Collect the requested metadata of a message, keyed by its column name."""
+	values = {}
+	for name in names:
+		if name == "topic":
+			values["_kafka_topic"] = msg.topic()
+		elif name == "partition":
+			values["_kafka_partition"] = msg.partition()
+		elif name == "offset":
+			values["_kafka_offset"] = msg.offset()
+		elif name == "key":
+			key = msg.key()
+			values["_kafka_key"] = key.decode("utf-8", errors="replace") if isinstance(key, bytes) else key
+		elif name == "timestamp":
+			kind, stamp = msg.timestamp()
+			values["_kafka_timestamp"] = None if kind == TIMESTAMP_NOT_AVAILABLE else datetime.fromtimestamp(stamp / 1000, tz=timezone.utc)
+	return values
+
+
+def layout_key(key: str) -> tuple[str, str]:
+	"""Split a partition/sort key into (column, SQL expression), e.g. day(ts) -> (ts, day("ts"))."""
+	match = PARTITION_KEY.match(key)
+	if match is None:
+		raise ValueError(f"unsupported partition key {key!r}: use a column or year/month/day/hour(column)")
+	transform, column = (match.group(1), match.group(2)) if match.group(1) else (None, match.group(3))
+	expression = f"{transform.lower()}({quote_identifier(column)})" if transform else quote_identifier(column)
+	return column, expression
+
+
+def partition_transform(key: str) -> tuple[str, str]:
+	"""(column, DuckLake transform) of a partition key as the catalog records it, e.g. day(ts) -> (ts, day), ts -> (ts, identity)."""
+	column, _ = layout_key(key)
+	transform = PARTITION_KEY.match(key).group(1)
+	return column, transform.lower() if transform else "identity"
+
+
+def split_top_level(body: str) -> list[str]:
+	"""Split a type list on the commas that are not nested in parentheses or quoted names."""
+	parts, depth, quoted, start = [], 0, False, 0
+	for index, char in enumerate(body):
+		if char == '"':
+			quoted = not quoted
+		elif not quoted and char == "(":
+			depth += 1
+		elif not quoted and char == ")":
+			depth -= 1
+		elif not quoted and depth == 0 and char == ",":
+			parts.append(body[start:index].strip())
+			start = index + 1
+	parts.append(body[start:].strip())
+	return [part for part in parts if part]
+
+
+def nested_children(type_name: str) -> tuple[Optional[str], list[tuple[str, str]]]:
+	"""
+	Children of a DuckDB nested type string as (kind, [(name, type)]): struct fields,
+	the `element` of a list or the `key`/`value` of a map; (None, []) for other types.
+	"""
+	upper = type_name.upper()
+	if type_name.endswith("[]"):
+		return "list", [("element", type_name[:-2])]
+	if upper.startswith("MAP(") and type_name.endswith(")"):
+		key, value = split_top_level(type_name[4:-1])
+		return "map", [("key", key), ("value", value)]
+	if upper.startswith("STRUCT(") and type_name.endswith(")"):
+		fields = []
+		for part in split_top_level(type_name[7:-1]):
+			if part.startswith('"'):
+				end = 1
+				while True:
+					end = part.index('"', end)
+					if part[end + 1:end + 2] != '"':
+						break
+					end += 2
+				fields.append((part[1:end].replace('""', '"'), part[end + 1:].strip()))
+			else:
+				name, field_type = part.split(" ", 1)
+				fields.append((name, field_type.strip()))
+		return "struct", fields
+	return None, []
+
+
+def missing_nested_fields(path: str, batch_type: str, table_type: str) -> list[tuple[str, str]]:
+	"""
+	Struct fields (at any depth, through lists and maps) that a batch column carries and the
+	table column lacks, as (ALTER TABLE ADD COLUMN path, type) pairs, e.g. ("child"."b", VARCHAR).
+	Differences between scalar types are left to DuckDB's casts.
+	"""
+	if batch_type == table_type:
+		return []
+	kind, batch_children = nested_children(batch_type)
+	table_kind, table_children = nested_children(table_type)
+	if kind is None or kind != table_kind:
+		return []
+	known = dict(table_children)
+	missing = []
+	for name, child_type in batch_children:
+		child_path = f"{path}.{quote_identifier(name) if kind == 'struct' else name}"
+		if name not in known:
+			missing.append((child_path, child_type))
+		else:
+			missing.extend(missing_nested_fields(child_path, child_type, known[name]))
+	return missing
+
+
+def has_nested_fields(schema: pa.Schema) -> bool:
+	return any(pa.types.is_nested(field.type) for field in schema)
+
+
+class PendingMessages:
+	"""
+	Messages consumed but not flushed yet, kept per (topic, partition) so that the
+	buffered messages of a revoked partition can be dropped on a rebalance.
+	"""
+	def __init__(self):
+		self.partitions: dict[tuple[str, int], tuple[list[bytes], list[dict]]] = {}
+		self.offsets: dict[tuple[str, int], int] = {}
+		self.rows = 0
+		self.bytes = 0
+
+	def add(self, msg, metadata: Optional[dict] = None) -> None:
+		key = (msg.topic(), msg.partition())
+		self.offsets[key] = msg.offset() + 1
+		value = msg.value()
+		if value is None:
+			# a tombstone (null value, e.g. on compacted topics) carries no row, only its offset moves on
+			return
+		payloads, rows = self.partitions.setdefault(key, ([], []))
+		payloads.append(value)
+		if metadata is not None:
+			rows.append(metadata)
+		self.rows += 1
+		self.bytes += len(value)
+
+	def drop(self, partitions: set[tuple[str, int]]) -> int:
+		"""Forget the messages of `partitions`; returns how many were dropped."""
+		dropped = 0
+		for key in partitions & self.offsets.keys():
+			payloads, _ = self.partitions.pop(key, ([], []))
+			self.offsets.pop(key)
+			dropped += len(payloads)
+			self.rows -= len(payloads)
+			self.bytes -= sum(len(payload) for payload in payloads)
+		return dropped
+
+	def groups(self, by_topic: bool) -> dict[str, tuple[list[bytes], list[dict]]]:
+		"""Payloads and metadata per topic (or all together under "" when topics need no telling apart)."""
+		groups: dict[str, tuple[list[bytes], list[dict]]] = {}
+		for (topic, _), (payloads, metadata) in self.partitions.items():
+			group = groups.setdefault(topic if by_topic else "", ([], []))
+			group[0].extend(payloads)
+			group[1].extend(metadata)
+		return groups
+
+	def commit_offsets(self) -> list[TopicPartition]:
+		return [TopicPartition(topic, partition, offset) for (topic, partition), offset in self.offsets.items()]
 
 
 class Connector(DuckLakeManager):
 	bootstrap_servers: str = None
 	base_config: dict = None
 	consumer_config:dict = None
+	stats_queue: Any = None
 	_consumers: list[Consumer] = []
+	_table_columns: dict[str, dict[str, str]] = {}
+	_checked_schemas: dict[str, set[pa.Schema]] = {}
+	_insert_statements: dict[tuple[str, tuple[str, ...]], str] = {}
+	_partitioned: set[str] = set()
+	_topic_routes: dict[str, list[RouteCnn]] = {}
+	_decoders: list[tuple[str, Optional[BatchDecoder]]] = []
+	_topic_decoders: dict[str, Optional[BatchDecoder]] = {}
+	_pending: Optional[PendingMessages] = None
+	_window: list = []
+	_write_queue: Optional[Queue] = None
+	_writer: Optional[threading.Thread] = None
+	_written: Optional[Queue] = None
 	def __init__(self,config_path):
 		super(Connector,self).__init__(config_path)
 		self.duckdb_connection.execute(f"use {self.DEST.catalog.lake_alias};")
@@ -27,6 +252,22 @@ class Connector(DuckLakeManager):
 						   'heartbeat.interval.ms': 600000
 						   }
 		self._consumers: list[Consumer] = []
+		self._table_columns: dict[str, dict[str, str]] = {}
+		self._checked_schemas: dict[str, set[pa.Schema]] = {}
+		self._insert_statements: dict[tuple[str, tuple[str, ...]], str] = {}
+		self._partitioned: set[str] = set()
+		self._topic_routes: dict[str, list[RouteCnn]] = {}
+		self._decoders = self._payload_decoders()
+		self._topic_decoders: dict[str, Optional[BatchDecoder]] = {}
+		self._pending: Optional[PendingMessages] = None
+		self._window: list = []
+		self._write_queue: Optional[Queue] = None
+		self._writer: Optional[threading.Thread] = None
+		self._written: Optional[Queue] = None
+		self.duckdb_connection.execute(
+			f"CREATE TABLE IF NOT EXISTS {self.SRC.stream.offsets_table} "
+			"(group_id VARCHAR, topic VARCHAR, partition_id INTEGER, next_offset BIGINT, committed_at TIMESTAMP WITH TIME ZONE);"
+		)
 		logger.warning(f"initializing kafka client {self.SRC.stream.url} topics={self.SRC.stream.ingest_topics} group={self.SRC.stream.group_id}")
 
 	@property
@@ -39,25 +280,114 @@ class Connector(DuckLakeManager):
 		"""Set the list of Kafka consumers."""
 		logger.warning(f"Cannot set {consumers} for consumers attribute, as it's read-only")
 
-	def on_assign_seek_to_beginning(self,consumer, partitions):
+	def on_assign_seek_to_stored(self, consumer, partitions):
 		"""
 		This function is called when partitions are assigned to the consumer.
-		It will seek to the beginning of each assigned partition.
+		Each partition resumes from the offset stored next to the data in the lake,
+		partitions that were never written start from the beginning.
 		"""
-		print("Partitions assigned, seeking to the beginning...")
+		stored = self.stored_offsets(self.SRC.stream.group_id)
 		for partition in partitions:
-			# Set the offset to the beginning of the partition
-			partition.offset = 0
-		# The consumer.assign() call is what actually applies the new assignments
+			partition.offset = stored.get((partition.topic, partition.partition), OFFSET_BEGINNING)
+		logger.info(f"Partitions assigned, resuming from stored offsets {[(p.topic, p.partition, p.offset) for p in partitions]}")
 		consumer.assign(partitions)
+
+	def on_revoke_drop_pending(self, consumer, partitions):
+		"""
+		This function is called before partitions are taken away from the consumer (rebalance or close).
+		Messages still buffered for them are dropped (their next owner re-reads them from the stored
+		offsets) and batches already handed to the writer are committed before returning, so no batch
+		of a revoked partition is written after another consumer resumed it.
+		"""
+		revoked = {(partition.topic, partition.partition) for partition in partitions}
+		dropped = self._pending.drop(revoked) if self._pending is not None else 0
+		kept = [msg for msg in self._window if msg is None or (msg.topic(), msg.partition()) not in revoked]
+		dropped += len(self._window) - len(kept)
+		self._window[:] = kept
+		self._drain_writes(consumer)
+		logger.info(f"Partitions revoked {sorted(revoked)}, dropped {dropped} buffered messages")
+
+	def _drain_writes(self, consumer) -> None:
+		"""Block until the writer committed every queued batch (and its transaction in flight)."""
+		batches, writer = self._write_queue, self._writer
+		if batches is None or writer is None:
+			return
+		with batches.all_tasks_done:
+			while batches.unfinished_tasks and writer.is_alive():
+				batches.all_tasks_done.wait(timeout=1.0)
+		self._commit_written(consumer, self._written)
+
+	def replay_from(self, timestamp_ms: Optional[int] = None, offsets: Optional[dict[tuple[str, int], int]] = None) -> dict[tuple[str, int], int]:
+		"""
+		Rewind the stored offsets of the consumer group to a point in time (resolved per partition
+		with offsets_for_times) or to explicit offsets; explicit offsets win over the timestamp.
+		Must run once before any worker starts: the resolved offsets are written to the offsets
+		table, so every worker (and every later reassignment) simply resumes from them.
+		"""
+		replay = dict(offsets or {})
+		if timestamp_ms is not None:
+			consumer = Consumer({**self.consumer_config, "group.id": self.SRC.stream.group_id})
+			try:
+				lookups = [
+					TopicPartition(topic, partition, timestamp_ms)
+					for topic, partition in self._topic_partitions(consumer) if (topic, partition) not in replay
+				]
+				# earliest offset whose message timestamp is >= timestamp_ms; a partition with none yet starts at its end
+				for found in consumer.offsets_for_times(lookups, timeout=30.0) if lookups else []:
+					if found.offset < 0:
+						_, found.offset = consumer.get_watermark_offsets(found, timeout=30.0)
+					replay[(found.topic, found.partition)] = found.offset
+			finally:
+				consumer.close()
+		if not replay:
+			logger.warning("nothing to replay: no partitions found for the subscribed topics")
+			return replay
+		cursor = self.duckdb_connection
+		try:
+			cursor.begin()
+			self._store_offsets(cursor, [TopicPartition(topic, partition, offset) for (topic, partition), offset in replay.items()])
+			cursor.commit()
+		except duckdb.Error:
+			self._rollback(cursor)
+			raise
+		logger.warning(f"replaying partitions from {sorted((topic, partition, offset) for (topic, partition), offset in replay.items())}")
+		return replay
+
+	def _topic_partitions(self, consumer) -> list[tuple[str, int]]:
+		"""(topic, partition) of every partition the ingest topics (names or ^regex subscriptions) currently have."""
+		subscriptions = self.SRC.stream.ingest_topics
+		patterns = [re.compile(topic) for topic in subscriptions if topic.startswith("^")]
+		return [
+			(name, partition)
+			for name, topic in consumer.list_topics(timeout=30.0).topics.items()
+			if name in subscriptions or any(pattern.match(name) for pattern in patterns)
+			for partition in topic.partitions
+		]
+
+	def stored_offsets(self, group: str) -> dict[tuple[str, int], int]:
+		"""Return the next offset to consume per (topic, partition) as recorded in the offsets table."""
+		rows = self.duckdb_connection.execute(
+			# the latest write wins (not the highest offset), so a replay resumes where it got to
+			f"SELECT topic, partition_id, arg_max(next_offset, committed_at) FROM {self.SRC.stream.offsets_table} "
+			"WHERE group_id = ? GROUP BY topic, partition_id",
+			[group],
+		).fetchall()
+		return {(topic, partition): offset for topic, partition, offset in rows}
+
+	def _store_offsets(self, cursor: DuckDBPyConnection, offsets: list[TopicPartition]) -> None:
+		"""Append the committed offsets of a batch; must run inside the batch's insert transaction."""
+		cursor.executemany(
+			f"INSERT INTO {self.SRC.stream.offsets_table} VALUES (?, ?, ?, ?, now())",
+			[[self.SRC.stream.group_id, tp.topic, tp.partition, tp.offset] for tp in offsets],
+		)
+
 	def open_consumer(self, group: str, topics: list[str]) -> Consumer | None:
 		"""Open a Kafka consumer."""
 		try:
 			consumer = Consumer({**self.consumer_config, "group.id": group})
 			self._consumers.append(consumer)
 			if consumer:
-				consumer.subscribe(topics, on_assign=self.on_assign_seek_to_beginning)
-				# consumer.subscribe(topics)
+				consumer.subscribe(topics, on_assign=self.on_assign_seek_to_stored, on_revoke=self.on_revoke_drop_pending)
 				logger.info(f"Opened Kafka consumer to broker at {self.bootstrap_servers} listening to {topics=}")
 		except KafkaException as e:
 			logger.error(f"Failed to open consumer to broker at {self.bootstrap_servers} listening to {topics=}: {e}")
@@ -82,16 +412,14 @@ class Connector(DuckLakeManager):
 					msg.value().decode("utf-8"),
 					msg.offset(),
 				)
-				logger.warning(f"{topic}|  OFFSET:{offset}")
+				logger.debug("%s| OFFSET:%s", topic, offset)
 				if msg.error():
 					if msg.error().code() == KafkaError._PARTITION_EOF:  # noqa: SLF001
 						logger.warning(f"Reached end of {partition=} in {topic=}")
 					else:
 						logger.error(f"Failed to consume message from {partition=}, {topic=}, {key=}: {msg.error()}")
 				else:
-					logger.info(
-						f"Consumed message with {key=}, {value=} from {topic=}, {partition=}, {offset=} successfully",
-					)
+					logger.debug("Consumed message with key=%s from topic=%s, partition=%s, offset=%s", key, topic, partition, offset)
 					consumer.commit(msg)
 					yield value
 		except KafkaException as e:
@@ -103,19 +431,30 @@ class Connector(DuckLakeManager):
     consumer: Consumer,
     timeout: float = 10.0,
     batch_size: int = 10000
-	) -> Optional[Generator[pd.DataFrame, None, None]]:
+	) -> Optional[Generator[tuple[list[tuple[str, pa.Table | pd.DataFrame]], list[TopicPartition]], None, None]]:
+		"""
+		Continuously consume messages from Kafka and coalesce them into micro-batches.
+		A batch is flushed once stream.flush_rows, stream.flush_bytes or stream.flush_interval
+		is reached, so quiet topics don't turn every poll into a tiny DuckLake file.
+		Yields the decoded batch, split into (table, frame) pairs by stream.routes, together
+		with the offsets to commit once every table of the batch is written.
+		"""
 		if not consumer or len(self._consumers) == 0:
 			logger.error(f"Kafka consumer to broker at {self.bootstrap_servers} is not open")
 			return None
 
+		stream = self.SRC.stream
+		decode_log = LogSampler(logger, f"decoded ({stream.decoder})", stream.log_every, stream.log_interval)
+		# shared with on_revoke_drop_pending, which drops the messages of revoked partitions
+		pending = self._pending = PendingMessages()
+		deadline = time.monotonic() + stream.flush_interval
 		try:
 			while True:
-				message_batch = consumer.consume(num_messages=batch_size, timeout=timeout)
-				if message_batch is None:
-					continue
-
-				valid_messages = []
-				for msg in message_batch:
+				wait = max(min(timeout, deadline - time.monotonic()), 0.0)
+				polled = time.perf_counter()
+				message_batch = consumer.consume(num_messages=batch_size, timeout=wait)
+				STAGE_SECONDS.observe(time.perf_counter() - polled, stage="poll")
+				for msg in message_batch or []:
 					if msg is None:
 						continue
 					if msg.error():
@@ -124,28 +463,223 @@ class Connector(DuckLakeManager):
 						else:
 							logger.error(f"Kafka error received: {msg.error()}")
 							continue
+					pending.add(msg, message_metadata(msg, stream.metadata_columns) if stream.metadata_columns else None)
 
-					try:
-						loaded_msg = json.loads(msg.value())
-						valid_messages.append(loaded_msg)
-					except Exception as fail:
-						logger.critical(f"failed to collect message bytes: {msg.value()} {fail}")
-						continue
-					# consumer.commit(msg)  # enable if you want manual commits
-
-				if not valid_messages or len(valid_messages) < 2:
-					logger.warning("not enough messages gathered in this poll session (continue collecting...)")
+				if pending.rows >= stream.flush_rows:
+					reason = "rows"
+				elif pending.bytes >= stream.flush_bytes:
+					reason = "bytes"
+				elif time.monotonic() >= deadline:
+					reason = "interval"
+				else:
+					continue
+				if not pending.rows:
+					deadline = time.monotonic() + stream.flush_interval
 					continue
 
-				# Flatten nested JSON; use pd.DataFrame(valid_messages) if you don't want flattening
-				df = pd.json_normalize(valid_messages, sep='.')
-				yield df
+				started = time.perf_counter()
+				# payloads and metadata per topic, topics are only told apart when routes or formats are configured
+				routed = self.route_batch(pending.groups(bool(stream.routes or stream.formats)))
+				elapsed = time.perf_counter() - started
+				STAGE_SECONDS.observe(elapsed, stage="decode")
+				rows, nbytes, offsets = pending.rows, pending.bytes, pending.commit_offsets()
+				pending = self._pending = PendingMessages()
+				deadline = time.monotonic() + stream.flush_interval
+				if routed:
+					logger.debug("flushing %d messages (%d bytes, reached %s)", rows, nbytes, reason)
+					decode_log.record(rows, nbytes, elapsed)
+					yield routed, offsets
 
 		except KafkaException as e:
 			logger.error(f"Failed to consume messages: {e}")
 		except KeyboardInterrupt:
 			logger.info("Consumer loop interrupted by user")
 
+	def route_batch(self, groups: dict[str, tuple[list[bytes], list[dict]]]) -> list[tuple[str, pa.Table | pd.DataFrame]]:
+		"""Decode the payloads of every topic and demultiplex them into one buffer per destination table."""
+		tables: dict[str, list[pa.Table | pd.DataFrame]] = {}
+		for topic, (payloads, metadata) in groups.items():
+			frame = self.decode_batch(payloads, metadata or None, topic)
+			if frame is None:
+				continue
+			for table, part in self.route_frame(topic, frame):
+				tables.setdefault(table, []).append(part)
+		return [(table, frame) for table, frames in tables.items() for frame in merge_frames(frames)]
+
+	def routes_for(self, topic: str) -> list[RouteCnn]:
+		"""Routes of stream.routes whose topic pattern matches `topic`, in configuration order."""
+		routes = self._topic_routes.get(topic)
+		if routes is None:
+			routes = [route for route in self.SRC.stream.routes if fnmatch.fnmatchcase(topic, route.topic)]
+			self._topic_routes[topic] = routes
+		return routes
+
+	def route_message(self, topic: str, record: dict) -> str:
+		"""Destination table of one decoded message: the first matching route, else stream.ingest_table."""
+		for route in self.routes_for(topic):
+			if route.field is None:
+				return route.table
+			value = record.get(route.field)
+			if value is not None and fnmatch.fnmatchcase(str(value), route.value):
+				return route.table
+		return self.SRC.stream.ingest_table
+
+	def route_frame(self, topic: str, frame: pa.Table | pd.DataFrame) -> list[tuple[str, pa.Table | pd.DataFrame]]:
+		"""
+		Split a decoded batch of one topic by stream.routes (first match wins, like route_message).
+		Field routes compare the distinct values of the field as strings, so a batch is split with
+		one vectorised mask per route; columns that end up all-null in a split are dropped.
+		"""
+		routes = self.routes_for(topic)
+		if not routes or routes[0].field is None:
+			return [(routes[0].table if routes else self.SRC.stream.ingest_table, frame)]
+		columns = set(frame_columns(frame))
+		remaining = np.ones(frame.shape[0], dtype=bool)
+		masks: dict[str, np.ndarray] = {}
+		for route in routes:
+			if route.field is None:
+				mask = remaining
+			elif route.field in columns:
+				mask = remaining & self._match_values(frame, route.field, route.value)
+			else:
+				continue
+			if mask.any():
+				masks[route.table] = masks[route.table] | mask if route.table in masks else mask
+				remaining = remaining & ~mask
+			if not remaining.any():
+				break
+		if remaining.any():
+			table = self.SRC.stream.ingest_table
+			masks[table] = masks[table] | remaining if table in masks else remaining
+		if len(masks) == 1:
+			return [(next(iter(masks)), frame)]
+		return [(table, self._take_rows(frame, mask)) for table, mask in masks.items()]
+
+	@staticmethod
+	def _match_values(frame: pa.Table | pd.DataFrame, field: str, pattern: str) -> np.ndarray:
+		if isinstance(frame, pa.Table):
+			try:
+				values = frame.column(field).cast(pa.string())
+			except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+				logger.warning(f"cannot route on non-scalar field {field}")
+				return np.zeros(frame.num_rows, dtype=bool)
+			matching = [value for value in pc.unique(values).to_pylist() if value is not None and fnmatch.fnmatchcase(value, pattern)]
+			return pc.is_in(values, value_set=pa.array(matching, pa.string())).to_numpy(zero_copy_only=False)
+		values = frame[field]
+		present = values.notna().to_numpy()
+		strings = values.astype(str)
+		matching = [value for value in strings[present].unique() if fnmatch.fnmatchcase(value, pattern)]
+		return strings.isin(matching).to_numpy() & present
+
+	@staticmethod
+	def _take_rows(frame: pa.Table | pd.DataFrame, mask: np.ndarray) -> pa.Table | pd.DataFrame:
+		# fields of other event types sharing the topic would otherwise widen every routed table
+		if isinstance(frame, pa.Table):
+			part = frame.filter(pa.array(mask))
+			return part.select([index for index, column in enumerate(part.columns) if column.null_count < part.num_rows])
+		return frame[mask].dropna(axis=1, how="all").reset_index(drop=True)
+
+	def _payload_decoders(self) -> list[tuple[str, Optional[BatchDecoder]]]:
+		decoders = []
+		for settings in self.SRC.stream.formats:
+			try:
+				decoders.append((settings.topic, make_decoder(settings)))
+			except ImportError as fail:
+				logger.critical(f"cannot decode {settings.format} payloads of topics {settings.topic}: {fail}")
+				sys.exit(1)
+		return decoders
+
+	def decoder_for(self, topic: str) -> Optional[BatchDecoder]:
+		"""Payload decoder of the first stream.formats entry matching `topic`, None for JSON."""
+		if topic not in self._topic_decoders:
+			self._topic_decoders[topic] = next(
+				(decoder for pattern, decoder in self._decoders if fnmatch.fnmatchcase(topic, pattern)), None
+			)
+		return self._topic_decoders[topic]
+
+	def decode_batch(self, payloads: list[bytes], metadata: Optional[list[dict]] = None, topic: str = "") -> pa.Table | pd.DataFrame | None:
+		"""
+		Decode raw message payloads of `topic`: binary formats (stream.formats) go through their
+		batch decoder, JSON through the decoder selected in stream.decoder.
+		When the arrow decoder cannot read a batch in one pass it decodes it message by message,
+		dropping malformed messages but keeping nested objects as structs, so the batch lands in
+		the same table shape (flattened columns only come from stream.decoder: pandas).
+		`metadata` holds one message_metadata() row per payload, appended as extra columns.
+		"""
+		decoder = self.decoder_for(topic) if self._decoders else None
+		if decoder is not None:
+			frame, kept = decoder.decode(payloads)
+			if frame is None:
+				return None
+			return self._with_metadata(frame, [metadata[index] for index in kept] if metadata else None)
+		if self.SRC.stream.decoder == "arrow":
+			try:
+				table = self._decode_arrow(payloads)
+				if metadata and table.num_rows != len(metadata):
+					raise pa.ArrowInvalid(f"{table.num_rows} rows decoded from {len(metadata)} messages")
+				return self._with_metadata(table, metadata)
+			except pa.ArrowInvalid as fail:
+				logger.warning(f"arrow decoder rejected batch, decoding it message by message: {fail}")
+				return self._decode_records(payloads, metadata)
+		return self._decode_pandas(payloads, metadata)
+
+	def _with_metadata(self, frame: pa.Table | pd.DataFrame, metadata: Optional[list[dict]]) -> pa.Table | pd.DataFrame:
+		if not metadata:
+			return frame
+		schema = pa.schema([METADATA_FIELDS[name] for name in self.SRC.stream.metadata_columns])
+		columns = pa.Table.from_pylist(metadata, schema=schema)
+		if isinstance(frame, pa.Table):
+			for field, column in zip(columns.schema, columns.columns):
+				frame = frame.append_column(field, column)
+			return frame
+		return pd.concat([frame.reset_index(drop=True), columns.to_pandas()], axis=1)
+
+	def _decode_arrow(self, payloads: list[bytes]) -> pa.Table:
+		"""Concatenate payloads into one newline-delimited buffer and read it with the arrow JSON reader."""
+		buffer = b"\n".join(payload.rstrip(b"\n") for payload in payloads)
+		read_options = pa_json.ReadOptions(block_size=max(len(buffer), 1 << 20))
+		return strings_for_null_columns(pa_json.read_json(pa.BufferReader(buffer), read_options=read_options))
+
+	def _decode_records(self, payloads: list[bytes], metadata: Optional[list[dict]] = None) -> pa.Table | None:
+		valid_messages, kept = self._parse_messages(payloads)
+		if not valid_messages:
+			return None
+		valid_payloads = [payloads[index] for index in kept]
+		try:
+			# without the malformed messages the arrow reader infers the usual types
+			table = self._decode_arrow(valid_payloads)
+			if table.num_rows != len(valid_payloads):
+				raise pa.ArrowInvalid(f"{table.num_rows} rows decoded from {len(valid_payloads)} messages")
+		except pa.ArrowInvalid as fail:
+			logger.warning(f"conflicting value types in batch, keeping them as strings: {fail}")
+			table = records_table(valid_messages)
+		return self._with_metadata(table, [metadata[index] for index in kept] if metadata else None)
+
+	@staticmethod
+	def _parse_messages(payloads: list[bytes]) -> tuple[list[dict], list[int]]:
+		"""json.loads every payload; returns the records (JSON objects only) and their indices."""
+		valid_messages = []
+		kept = []
+		for index, payload in enumerate(payloads):
+			try:
+				record = json.loads(payload)
+				if not isinstance(record, dict):
+					raise ValueError(f"expected a JSON object, got {type(record).__name__}")
+				valid_messages.append(record)
+				kept.append(index)
+			except Exception as fail:
+				logger.critical(f"failed to collect message bytes: {payload} {fail}")
+				continue
+		return valid_messages, kept
+
+	def _decode_pandas(self, payloads: list[bytes], metadata: Optional[list[dict]] = None) -> pd.DataFrame | None:
+		valid_messages, kept = self._parse_messages(payloads)
+		if not valid_messages:
+			return None
+		# Flatten nested JSON; use pd.DataFrame(valid_messages) if you don't want flattening
+		frame = pd.json_normalize(valid_messages, sep='.')
+		return self._with_metadata(frame, [metadata[index] for index in kept] if metadata else None)
+
 	def close_consumer(self, consumer: Consumer) -> bool:
 		"""
 		Close the Kafka consumer.
@@ -158,66 +692,369 @@ class Connector(DuckLakeManager):
 			logger.info(f"Kafka consumer on broker at {self.bootstrap_servers} closed successfully.")
 		return consumer not in self._consumers
 	
-	def infer_type(self,value):
-		"""Infer PostgreSQL data type based on Python value"""
-		if isinstance(value, int):
-			return 'INTEGER'
-		elif isinstance(value, float):
-			return 'FLOAT'
-		elif isinstance(value, str):
-			return 'VARCHAR'  # or TEXT based on your requirements
-		elif isinstance(value, bool):
-			return 'BOOLEAN'
-		elif isinstance(value, list):
-			return 'JSONB'  # Handle arrays or lists as JSONB
-		elif isinstance(value, dict):
-			return 'JSONB'  # Handle objects as JSONB
-		else:
-			return 'TEXT'  # Fallback type
+	def template_adapter(self, cursor: DuckDBPyConnection, table: str, frame_name: str, columns: list[str], schema: Optional[pa.Schema] = None) -> None:
+		"""
+		Make sure `table` can take a batch registered as `frame_name` by name.
+		The table is created from the first batch and widened with ALTER TABLE ADD COLUMN
+		whenever a batch carries fields that were never seen before, top-level columns as well as
+		fields inside nested objects (INSERT BY NAME would otherwise cast them away). Column types
+		are cached per table, so a batch with a familiar shape costs one lookup per column; nested
+		types are compared once per distinct Arrow `schema` of the batches.
+		"""
+		known = self._table_columns.get(table)
+		if known is None:
+			known = self._column_types(cursor, table)
+			self._table_columns[table] = known
+			if known:
+				self._apply_partitioning(cursor, table)
+		missing = [name for name in columns if name not in known]
+		checked = self._checked_schemas.setdefault(table, set())
+		nested = schema is not None and schema not in checked and has_nested_fields(schema)
+		if not missing and not nested:
+			return
+		# types come from DuckDB's own view of the whole batch, not from a single sample
+		types = dict(cursor.execute(f"SELECT column_name, column_type FROM (DESCRIBE SELECT * FROM {frame_name})").fetchall())
+		if missing:
+			definitions = [f"{quote_identifier(name)} {types[name]}" for name in missing]
+			if not known:
+				statement = f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(definitions)});"
+				cursor.execute(statement)
+				logger.info(f"{statement} created ingest table from batch schema")
+			else:
+				for definition in definitions:
+					cursor.execute(f"ALTER TABLE {table} ADD COLUMN {definition};")
+				logger.warning(f"schema of {table} evolved, added columns: {definitions}")
+			known.update((name, types[name]) for name in missing)
+		if nested:
+			self._widen_nested(cursor, table, types, known)
+			checked.add(schema)
+		self._apply_partitioning(cursor, table)
 
+	def _column_types(self, cursor: DuckDBPyConnection, table: str) -> dict[str, str]:
+		return dict(
+			cursor.execute(
+				"SELECT column_name, data_type FROM information_schema.columns "
+				"WHERE table_catalog = current_database() AND table_schema = current_schema() AND table_name = ?",
+				[table],
+			).fetchall()
+		)
+
+	def _widen_nested(self, cursor: DuckDBPyConnection, table: str, types: dict[str, str], known: dict[str, str]) -> None:
+		additions = []
+		for name, batch_type in types.items():
+			if name in known:
+				additions.extend(missing_nested_fields(quote_identifier(name), batch_type, known[name]))
+		if not additions:
+			return
+		for path, field_type in additions:
+			cursor.execute(f"ALTER TABLE {table} ADD COLUMN {path} {field_type};")
+		logger.warning(f"schema of {table} evolved, added nested fields: {[f'{path} {field_type}' for path, field_type in additions]}")
+		known.update(self._column_types(cursor, table))
+
+	def _apply_partitioning(self, cursor: DuckDBPyConnection, table: str) -> None:
+		"""
+		Set DuckLake partitioning of `table` from stream.partition_by, only when the catalog records a
+		different one: restarts, failed writes and parallel workers would otherwise each issue (and
+		conflict on) the same ALTER inside their data transactions. Checked once per table and process.
+		"""
+		if not self.SRC.stream.partition_by or table in self._partitioned:
+			return
+		keys = [layout_key(key) for key in self.SRC.stream.partition_by]
+		known = self._table_columns.get(table, {})
+		missing = [column for column, _ in keys if column not in known]
+		if missing:
+			logger.warning(f"cannot partition {table} yet, columns {missing} were not ingested so far")
+			return
+		wanted = [partition_transform(key) for key in self.SRC.stream.partition_by]
+		schema = cursor.execute("SELECT current_schema()").fetchone()[0]
+		if self._current_partitioning(schema, table) != wanted:
+			cursor.execute(f"ALTER TABLE {table} SET PARTITIONED BY ({', '.join(expression for _, expression in keys)});")
+			logger.info(f"{table} partitioned by {self.SRC.stream.partition_by}")
+		self._partitioned.add(table)
+
+	def _current_partitioning(self, schema: str, table: str) -> Optional[list[tuple[str, str]]]:
+		"""
+		Committed partition keys of `table` as (column, transform) pairs, read from the DuckLake metadata
+		catalog on a cursor of its own so that the data transaction is untouched; None if it cannot be read.
+		"""
+		metadata = quote_identifier(f"__ducklake_metadata_{self.DEST.catalog.lake_alias}")
+		cursor = self.cursor()
+		try:
+			return cursor.execute(
+				f"SELECT c.column_name, p.transform FROM {metadata}.ducklake_partition_info i "
+				f"JOIN {metadata}.ducklake_partition_column p ON p.partition_id = i.partition_id AND p.table_id = i.table_id "
+				f"JOIN {metadata}.ducklake_column c ON c.table_id = p.table_id AND c.column_id = p.column_id AND c.end_snapshot IS NULL "
+				f"JOIN {metadata}.ducklake_table t ON t.table_id = i.table_id AND t.end_snapshot IS NULL "
+				f"JOIN {metadata}.ducklake_schema s ON s.schema_id = t.schema_id AND s.end_snapshot IS NULL "
+				"WHERE i.end_snapshot IS NULL AND t.table_name = ? AND s.schema_name = ? ORDER BY p.partition_key_index",
+				[table, schema],
+			).fetchall()
+		except duckdb.Error as fail:
+			logger.warning(f"cannot read the partitioning of {table} from the catalog, setting it again: {fail}")
+			return None
+		finally:
+			cursor.close()
+
+	def ordering(self, columns: list[str] | tuple[str, ...]) -> str:
+		"""
+		ORDER BY clause grouping a batch by partition, then by stream.sort_by, so every data file
+		covers one partition and a narrow min/max range of the sort key. Keys whose column is
+		missing from the batch are skipped.
+		"""
+		present = set(columns)
+		expressions = []
+		for key in self.SRC.stream.partition_by + self.SRC.stream.sort_by:
+			column, expression = layout_key(key)
+			if column in present and expression not in expressions:
+				expressions.append(expression)
+		return f" ORDER BY {', '.join(expressions)}" if expressions else ""
 
-	def template_adapter(self,consumer):
-		while True:
-			msg = consumer.poll(timeout=4.0)
-			if msg is None:
-				continue
-			else:
-				sample_msg = json.loads(msg.value().decode('utf-8'))
-				logger.info(f"sample message value= ({sample_msg})")
-				columns = []
-				for key, value in sample_msg.items():
-					pg_type = self.infer_type(value)
-					columns.append(f"{key} {pg_type}")
-				columns_sql = ', '.join(columns)
-				create_statement = f"CREATE TABLE IF NOT EXISTS {self.SRC.stream.ingest_table} ({columns_sql});"
-				table_generate_result = self.duckdb_connection.sql(create_statement)
-				print(self.duckdb_connection.table(self.SRC.stream.ingest_table).show())
-				logger.info(f"{create_statement} Returned -> {table_generate_result}")
-				return
-	
 	def attach(self):
 		consumer = self.open_consumer(self.SRC.stream.group_id,self.SRC.stream.ingest_topics)
-		self.template_adapter(consumer)
+		batches: Queue = Queue(maxsize=self.SRC.stream.queue_size)
+		written: Queue = Queue()
+		writer = threading.Thread(target=self._write_batches, args=(batches, written), name="ducklake-writer", daemon=True)
+		writer.start()
+		# on_revoke_drop_pending waits for this queue to be written before giving partitions away
+		self._write_queue, self._writer, self._written = batches, writer, written
+		writer_failed = False
 		try:
-			for messages_frame in self.consume_batch(consumer,batch_size=self.SRC.stream.batch_size):
-				logger.warning(f"inserting new frame ({messages_frame.shape}) into {self.SRC.stream.ingest_table}")
-				logger.info(messages_frame)
-				self.duckdb_connection.sql(f"INSERT INTO {self.SRC.stream.ingest_table} (SELECT * FROM messages_frame)")
+			for batch in self.consume_batch(consumer,batch_size=self.SRC.stream.batch_size):
+				self._commit_written(consumer, written)
+				# blocks while the writer is behind, which keeps the poller from outrunning S3
+				while writer.is_alive():
+					try:
+						batches.put(batch, timeout=1.0)
+						WRITE_QUEUE_DEPTH.set(batches.qsize())
+						break
+					except Full:
+						self._commit_written(consumer, written)
+				if not writer.is_alive():
+					logger.critical("ducklake writer stopped, detaching from stream")
+					writer_failed = True
+					break
 		finally:
+			if writer.is_alive():
+				batches.put(None)
+				writer.join()
+			self._commit_written(consumer, written)
+			self._write_queue, self._writer, self._written = None, None, None
 			self.close_consumer(consumer)
-	def single_message(self,batch_size:int):
+		if writer_failed:
+			sys.exit(1)
+
+	def _write_batches(self, batches: Queue, written: Queue) -> None:
+		"""
+		Drain decoded batches into their tables on a dedicated cursor.
+		Every table of a batch and its offsets commit in one transaction; offsets of a
+		batch are handed back for commit only after that transaction succeeded.
+		"""
+		cursor = self.duckdb_connection.cursor()
+		cursor.execute(f"use {self.DEST.catalog.lake_alias};")
+		baseline = (time.monotonic(), self.ingest_file_stats(cursor)[0])
+		label = "routed tables" if self.SRC.stream.routes else self.SRC.stream.ingest_table
+		write_log = LogSampler(logger, f"written into {label}", self.SRC.stream.log_every, self.SRC.stream.log_interval)
+		try:
+			while True:
+				batch = batches.get()
+				WRITE_QUEUE_DEPTH.set(batches.qsize())
+				try:
+					if batch is None or not self._write_batch(cursor, batch, written, write_log, baseline):
+						return
+				finally:
+					# lets on_revoke_drop_pending know the batch is committed (or abandoned)
+					batches.task_done()
+		finally:
+			cursor.close()
+
+	def _write_batch(self, cursor: DuckDBPyConnection, batch: tuple, written: Queue, write_log: LogSampler, baseline: tuple[float, int]) -> bool:
+		"""Write every table of a batch and its offsets in one transaction; False when the writer must stop."""
+		routed, offsets = batch
+		started = time.perf_counter()
+		try:
+			# data and offsets land in one DuckLake snapshot, so a restart never replays a written batch
+			cursor.begin()
+			for table, messages_frame in routed:
+				cursor.register("messages_frame", messages_frame)
+				try:
+					schema = messages_frame.schema if isinstance(messages_frame, pa.Table) else None
+					self.template_adapter(cursor, table, "messages_frame", frame_columns(messages_frame), schema)
+					self.execute(
+						f"INSERT INTO {table} BY NAME (SELECT * FROM messages_frame{self.ordering(frame_columns(messages_frame))})",
+						cursor=cursor,
+					)
+				finally:
+					cursor.unregister("messages_frame")
+			self._store_offsets(cursor, offsets)
+			cursor.commit()
+		except duckdb.Error as fail:
+			tables = [table for table, _ in routed]
+			logger.critical(f"failed to write frame into {tables} (offsets left uncommitted): {fail}")
+			self._rollback(cursor)
+			for table in tables:
+				self._table_columns.pop(table, None)
+				self._checked_schemas.pop(table, None)
+				self._partitioned.discard(table)
+			return False
+		written.put(offsets)
+		rows, nbytes = 0, 0
+		for table, messages_frame in routed:
+			rows += messages_frame.shape[0]
+			nbytes += frame_nbytes(messages_frame)
+			INGESTED_MESSAGES.inc(messages_frame.shape[0], table=table)
+			INGESTED_BYTES.inc(frame_nbytes(messages_frame), table=table)
+		STAGE_SECONDS.observe(time.perf_counter() - started, stage="insert")
+		if self.stats_queue is not None:
+			self.stats_queue.put((os.getpid(), rows, time.time()))
+		# the catalog file statistics ride along with the sampled summary instead of every batch
+		if write_log.record(rows, nbytes, time.perf_counter() - started):
+			self._report_file_stats(cursor, baseline)
+		return True
+
+	def ingest_file_stats(self, cursor: DuckDBPyConnection | None = None) -> tuple[int, int]:
+		"""Return (data file count, total data file bytes) of the ingest table from the DuckLake catalog."""
+		cursor = cursor or self.duckdb_connection
+		try:
+			row = cursor.execute(
+				f"SELECT file_count, file_size_bytes FROM ducklake_table_info('{self.DEST.catalog.lake_alias}') WHERE table_name = ?",
+				[self.SRC.stream.ingest_table],
+			).fetchone()
+		except duckdb.Error as fail:
+			logger.debug(f"cannot read file statistics of {self.SRC.stream.ingest_table}: {fail}")
+			return 0, 0
+		return (row[0], row[1]) if row else (0, 0)
+
+	def _report_file_stats(self, cursor: DuckDBPyConnection, baseline: tuple[float, int]) -> None:
+		started, files_at_start = baseline
+		file_count, file_size = self.ingest_file_stats(cursor)
+		hours = max(time.monotonic() - started, 1.0) / 3600
+		logger.info(
+			f"{self.SRC.stream.ingest_table}: {file_count} data files, "
+			f"{(file_count - files_at_start) / hours:.1f} files/hour since attach, "
+			f"average file size {file_size / max(file_count, 1) / (1 << 20):.2f} MiB"
+		)
+
+	def _commit_written(self, consumer: Consumer, written: Queue) -> None:
+		"""Commit offsets of every batch the writer has finished so far."""
+		while True:
+			try:
+				offsets = written.get_nowait()
+			except Empty:
+				return
+			started = time.perf_counter()
+			try:
+				consumer.commit(offsets=offsets, asynchronous=False)
+			except KafkaException as e:
+				logger.error(f"Failed to commit offsets {offsets}: {e}")
+			STAGE_SECONDS.observe(time.perf_counter() - started, stage="commit")
+			self._record_lag(consumer, offsets)
+
+	def _record_lag(self, consumer: Consumer, offsets: list[TopicPartition]) -> None:
+		"""Publish per-partition lag from the locally cached high watermarks (no broker round-trip)."""
+		for tp in offsets:
+			try:
+				_, high = consumer.get_watermark_offsets(tp, cached=True)
+			except KafkaException:
+				continue
+			if high >= 0:
+				CONSUMER_LAG.set(max(high - tp.offset, 0), topic=tp.topic, partition=tp.partition)
+
+	def single_message(self,batch_size:int = 1000):
+		"""
+		Low-latency ingest: every message is written and committed as soon as possible,
+		but messages arriving within stream.linger_ms of each other share one append
+		(and one DuckLake snapshot) instead of paying a snapshot per row.
+		"""
 		consumer = self.open_consumer(self.SRC.stream.group_id,self.SRC.stream.ingest_topics)
-		self.template_adapter(consumer)
+		linger = self.SRC.stream.linger_ms / 1000
+		window_log = LogSampler(logger, f"written into {self.SRC.stream.ingest_table}", self.SRC.stream.log_every, self.SRC.stream.log_interval)
 		try:
-			for message in self.consume_messages(consumer):
-				data = json.loads(message)
-				keys = ', '.join(data.keys())
-				placeholders = ', '.join(['?'] * len(data)) 
-				values = tuple(data.values())
-				insert_statement = f"INSERT INTO {self.SRC.stream.ingest_table} ({keys}) VALUES ({placeholders})"
-				insert_result = self.duckdb_connection.execute(insert_statement, values)
-				logger.info(f"{insert_statement} Results-> {insert_result.fetchall()}")
+			while True:
+				first = consumer.poll(timeout=4.0)
+				if first is None:
+					continue
+				# shared with on_revoke_drop_pending, which drops the messages of revoked partitions
+				window = self._window = [first]
+				deadline = time.monotonic() + linger
+				while len(window) < batch_size:
+					remaining = deadline - time.monotonic()
+					if remaining <= 0:
+						break
+					window.extend(consumer.consume(num_messages=batch_size - len(window), timeout=remaining))
+				started = time.perf_counter()
+				self._write_window(consumer, window)
+				elapsed = time.perf_counter() - started
+				STAGE_SECONDS.observe(elapsed, stage="insert")
+				window_log.record(len(window), sum(len(msg.value() or b"") for msg in window), elapsed)
+				self._window = []
+		except KafkaException as e:
+			logger.error(f"Failed to consume messages: {e}")
+		except KeyboardInterrupt:
+			logger.info("Consumer loop interrupted by user")
 		finally:
 			self.close_consumer(consumer)
+
+	def _write_window(self, consumer: Consumer, window: list) -> None:
+		"""Append one linger window to its tables (stream.routes) in one transaction, then commit its offsets."""
+		groups: dict[tuple[str, tuple[str, ...]], list[dict]] = {}
+		offsets = {}
+		for msg in window:
+			if msg is None or msg.error():
+				if msg is not None and msg.error().code() != KafkaError._PARTITION_EOF:
+					logger.error(f"Kafka error received: {msg.error()}")
+				continue
+			offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+			if msg.value() is None:
+				continue  # tombstone: no row, the offset still moves on
+			decoder = self.decoder_for(msg.topic()) if self._decoders else None
+			try:
+				data = decoder.decode_one(msg.value()) if decoder is not None else json.loads(msg.value())
+			except Exception as fail:
+				logger.critical(f"failed to collect message bytes: {msg.value()} {fail}")
+				continue
+			if self.SRC.stream.metadata_columns:
+				data.update(message_metadata(msg, self.SRC.stream.metadata_columns))
+			table = self.route_message(msg.topic(), data) if self.SRC.stream.routes else self.SRC.stream.ingest_table
+			groups.setdefault((table, tuple(data.keys())), []).append(data)
+		if not offsets:
+			return
+		committed = [TopicPartition(topic, partition, offset) for (topic, partition), offset in offsets.items()]
+		# built before the transaction opens, so a conversion problem never leaves it dangling
+		frames = {key: records_table(rows) for key, rows in groups.items()}
+		cursor = self.duckdb_connection
+		try:
+			cursor.begin()
+			for (table, columns), frame in frames.items():
+				cursor.register("message_window", frame)
+				try:
+					self.template_adapter(cursor, table, "message_window", list(columns), frame.schema)
+					self.execute(self._insert_statement(table, columns), cursor=cursor)
+				finally:
+					cursor.unregister("message_window")
+			self._store_offsets(cursor, committed)
+			cursor.commit()
+		except (duckdb.Error, pa.ArrowException) as fail:
+			tables = sorted({table for table, _ in groups})
+			logger.critical(f"failed to write {len(window)} messages into {tables} (offsets left uncommitted): {fail}")
+			self._rollback(cursor)
+			for table in tables:
+				self._table_columns.pop(table, None)
+				self._checked_schemas.pop(table, None)
+				self._partitioned.discard(table)
+			raise
+		consumer.commit(offsets=committed, asynchronous=False)
+		for (table, _), rows in groups.items():
+			INGESTED_MESSAGES.inc(len(rows), table=table)
+
+	def _insert_statement(self, table: str, columns: tuple[str, ...]) -> str:
+		"""Return the cached append statement for a column set."""
+		key = (table, columns)
+		statement = self._insert_statements.get(key)
+		if statement is None:
+			column_list = ', '.join(quote_identifier(name) for name in columns)
+			statement = f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM message_window{self.ordering(columns)}"
+			self._insert_statements[key] = statement
+		return statement
+
 	def exec(self,cmd:str):
-		return self.duckdb_connection.execute(cmd)
\ No newline at end of file
+		return self.execute(cmd)
\ No newline at end of file
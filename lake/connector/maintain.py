@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from urllib.parse import urlparse
+import duckdb
+from botocore.exceptions import ClientError
+from lake.connector.core import DuckLakeManager, LakeSession, sql_literal
+from lake.util.logger import logger
+from lake.util.metrics import registry
+
+RECLAIMED_FILES = registry.counter("lake_maintenance_files_reclaimed_total", "Data files removed by lake maintenance", ("step",))
+RECLAIMED_BYTES = registry.counter("lake_maintenance_bytes_reclaimed_total", "Bytes removed by lake maintenance", ("step",))
+EXPIRED_SNAPSHOTS = registry.counter("lake_maintenance_snapshots_expired_total", "Snapshots expired by lake maintenance")
+
+
+class Connector(DuckLakeManager):
+    """
+    Periodic lake maintenance (DEST.maintenance): merge adjacent small files table by table, expire old
+    snapshots, then delete the files they no longer reference (and orphaned files, when DuckLake supports it).
+    Each step pauses `pause` seconds between tables/steps and the standalone command runs DuckDB on
+    `threads` threads, so maintenance doesn't compete with ingest for CPU or catalog locks.
+    """
+    _in_process: bool = False
+
+    def __init__(self, config_path):
+        super(Connector, self).__init__(config_path)
+        self._in_process = False
+        self.execute(f"use {self.DEST.catalog.lake_alias};")
+
+    def maintain(self) -> dict:
+        """Run one maintenance cycle and return what it reclaimed."""
+        settings = self.DEST.maintenance
+        if settings.threads and not self._in_process:
+            # the standalone command (one-shot or looping) only maintains, so the engine-wide setting is safe;
+            # next to an ingest loop (start()) the session is shared and keeps its threads
+            self.execute(f"SET threads = {int(settings.threads)};")
+        started = time.perf_counter()
+        report = {"merged_files": 0, "expired_snapshots": 0, "deleted_files": 0, "deleted_bytes": 0}
+        if settings.merge:
+            report["merged_files"] = self.merge_adjacent_files(settings.tables)
+        if settings.expire_older_than:
+            report["expired_snapshots"] = self.expire_snapshots(settings.expire_older_than)
+            time.sleep(settings.pause)
+        if settings.cleanup_older_than:
+            files, size = self.cleanup_files("ducklake_cleanup_old_files", settings.cleanup_older_than)
+            report["deleted_files"] += files
+            report["deleted_bytes"] += size
+            if settings.delete_orphans:
+                time.sleep(settings.pause)
+                files, size = self.cleanup_files("ducklake_delete_orphaned_files", settings.cleanup_older_than)
+                report["deleted_files"] += files
+                report["deleted_bytes"] += size
+        logger.info(
+            f"lake maintenance: merged away {report['merged_files']} files, "
+            f"expired {report['expired_snapshots']} snapshots, deleted {report['deleted_files']} files "
+            f"({report['deleted_bytes'] / 1024 / 1024:.1f}MiB) in {time.perf_counter() - started:.2f}s"
+        )
+        return report
+
+    def run(self, interval: float) -> None:
+        """Maintain the lake every `interval` seconds until interrupted (standalone `lake maintain`)."""
+        try:
+            while True:
+                self._safe_maintain()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            logger.info("lake maintenance interrupted by user")
+
+    def start(self, interval: float) -> threading.Thread:
+        """Maintain the lake from a daemon thread of the current process (e.g. next to an ingest loop)."""
+        self._in_process = True
+        def maintain_loop():
+            while True:
+                time.sleep(interval)
+                self._safe_maintain()
+        thread = threading.Thread(target=maintain_loop, name="lake-maintenance", daemon=True)
+        thread.start()
+        return thread
+
+    def _safe_maintain(self) -> None:
+        try:
+            self.maintain()
+        except duckdb.Error as fail:
+            logger.error(f"lake maintenance failed: {fail}")
+
+    def _table_files(self) -> dict[str, tuple[int, int]]:
+        return {
+            name: (files, size)
+            for name, files, size in self.execute(
+                f"SELECT table_name, file_count, file_size_bytes FROM ducklake_table_info('{self.DEST.catalog.lake_alias}')"
+            ).fetchall()
+        }
+
+    def merge_adjacent_files(self, tables: list[str] | None = None) -> int:
+        """Compact small files of each table (all lake tables by default); returns how many live files were merged away."""
+        before = self._table_files()
+        candidates = [table for table in (tables or sorted(before)) if before.get(table, (0, 0))[0] > 1]
+        for table in candidates:
+            try:
+                self.execute(f"CALL ducklake_merge_adjacent_files('{self.DEST.catalog.lake_alias}', {sql_literal(table)})")
+            except duckdb.BinderException:
+                # DuckLake versions without per-table merging compact the whole lake in one call
+                logger.debug("per-table merge is not supported by this DuckLake version, merging the whole lake")
+                self.execute(f"CALL ducklake_merge_adjacent_files('{self.DEST.catalog.lake_alias}')")
+                candidates = sorted(before)
+                break
+            time.sleep(self.DEST.maintenance.pause)
+        after = self._table_files()
+        merged = sum(before[table][0] - after.get(table, (0, 0))[0] for table in candidates)
+        # replaced files stay on storage until cleanup_files() deletes them, that is where bytes are reclaimed
+        RECLAIMED_FILES.inc(merged, step="merge")
+        return merged
+
+    def _older_than(self, interval: str) -> str:
+        cutoff = self.execute("SELECT CAST(now() - CAST(? AS INTERVAL) AS VARCHAR)", [interval]).fetchone()[0]
+        return f"TIMESTAMPTZ '{cutoff}'"
+
+    def expire_snapshots(self, older_than: str) -> int:
+        expired = self.execute(
+            f"CALL ducklake_expire_snapshots('{self.DEST.catalog.lake_alias}', older_than => {self._older_than(older_than)})"
+        ).fetchall()
+        EXPIRED_SNAPSHOTS.inc(len(expired))
+        return len(expired)
+
+    def cleanup_files(self, function: str, older_than: str) -> tuple[int, int]:
+        """Delete files through a DuckLake cleanup function; sizes are taken from a dry run before deleting."""
+        call = f"CALL {function}('{self.DEST.catalog.lake_alias}', older_than => {self._older_than(older_than)}"
+        try:
+            paths = [row[0] for row in self.execute(f"{call}, dry_run => true)").fetchall()]
+        except duckdb.CatalogException:
+            logger.warning(f"{function} is not available in this DuckLake version, its files are not cleaned up")
+            return 0, 0
+        if not paths:
+            return 0, 0
+        size = sum(self._file_size(path) for path in paths)
+        self.execute(f"{call})")
+        RECLAIMED_FILES.inc(len(paths), step=function)
+        RECLAIMED_BYTES.inc(size, step=function)
+        return len(paths), size
+
+    def _file_size(self, path: str) -> int:
+        if not path.startswith("s3://"):
+            return os.path.getsize(path) if os.path.exists(path) else 0
+        location = urlparse(path)
+        try:
+            return LakeSession.s3_client(self.DEST.storage).head_object(Bucket=location.netloc, Key=location.path.lstrip("/"))["ContentLength"]
+        except ClientError:
+            return 0
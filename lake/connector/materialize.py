@@ -0,0 +1,144 @@
+import re
+import time
+import duckdb
+import pyarrow as pa
+from lake.connector.core import DuckLakeManager, quote_identifier
+from lake.util.conf_loader import AggregateCnn
+from lake.util.logger import logger
+
+MEASURE = re.compile(r"^\s*(count|sum)\s*\(\s*(\*|[^()]+?)\s*\)\s*$", re.IGNORECASE)
+# sign each change row contributes to a group: inserts add, deletes subtract, updates do both
+CHANGE_SIGN = (
+    "CASE change_type WHEN 'insert' THEN 1 WHEN 'update_postimage' THEN 1 "
+    "WHEN 'delete' THEN -1 WHEN 'update_preimage' THEN -1 ELSE 0 END"
+)
+ROWS_COLUMN = "_mv_rows"
+
+
+def parse_measure(measure: str) -> tuple[str, str]:
+    match = MEASURE.match(measure)
+    if match is None:
+        raise ValueError(f"unsupported aggregate {measure!r}: only count(*), count(expr) and sum(expr) can be maintained incrementally")
+    return match.group(1).lower(), match.group(2)
+
+
+def full_expression(measure: str) -> str:
+    """A measure over the whole source; sums of groups without any non-NULL value are 0, as delta maintenance keeps them."""
+    function, argument = parse_measure(measure)
+    return f"coalesce(sum({argument}), 0)" if function == "sum" else measure
+
+
+def delta_expression(measure: str) -> str:
+    """Translate count(*) / count(x) / sum(x) into its signed form over table_changes()."""
+    function, argument = parse_measure(measure)
+    if function == "count" and argument == "*":
+        return f"sum({CHANGE_SIGN})"
+    if function == "count":
+        return f"sum(CASE WHEN ({argument}) IS NOT NULL THEN {CHANGE_SIGN} ELSE 0 END)"
+    # a delta of only NULL values adds nothing (instead of turning the running sum into NULL)
+    return f"coalesce(sum(({argument}) * {CHANGE_SIGN}), 0)"
+
+
+class Connector(DuckLakeManager):
+    """
+    Materialized aggregates over lake tables (stream.aggregates).
+    The first refresh computes each summary table in full; later refreshes read only the
+    rows inserted/deleted since the last processed snapshot through DuckLake's table_changes()
+    and fold them into the summary, so maintenance cost follows the delta, not the table.
+    """
+    state_table: str = "ducklake_mv_state"
+
+    def __init__(self, config_path):
+        super(Connector, self).__init__(config_path)
+        self.execute(f"use {self.DEST.catalog.lake_alias};")
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.state_table} "
+            "(name VARCHAR, last_snapshot BIGINT, refreshed_at TIMESTAMP WITH TIME ZONE);"
+        )
+
+    def last_snapshot(self, name: str) -> int | None:
+        return self.execute(f"SELECT max(last_snapshot) FROM {self.state_table} WHERE name = ?", [name]).fetchone()[0]
+
+    def refresh(self) -> None:
+        """Bring every declared aggregate up to the current lake snapshot."""
+        for aggregate in self.SRC.stream.aggregates:
+            started = time.perf_counter()
+            current = self.current_snapshot_id()
+            last = self.last_snapshot(aggregate.name)
+            if current is None or current == last:
+                continue
+            try:
+                delta = None if last is None else self._delta(aggregate, last + 1, current)
+                if delta is not None and delta.num_rows == 0:
+                    # the source did not change: committing a state row would only add an empty snapshot
+                    logger.debug(f"aggregate {aggregate.name} is up to date (no changes in {last + 1}..{current})")
+                    continue
+                self.duckdb_connection.begin()
+                if delta is None:
+                    self._rebuild(aggregate, current)
+                    mode = "full"
+                else:
+                    self._apply_delta(aggregate, delta)
+                    mode = f"delta {last + 1}..{current}"
+                self.execute(f"INSERT INTO {self.state_table} VALUES (?, ?, now())", [aggregate.name, current])
+                self.duckdb_connection.commit()
+            except duckdb.Error as fail:
+                logger.error(f"failed to refresh aggregate {aggregate.name}: {fail}")
+                self._rollback(self.duckdb_connection)
+                continue
+            logger.info(f"refreshed aggregate {aggregate.name} ({mode}) in {time.perf_counter() - started:.2f}s")
+
+    def run(self, interval: float) -> None:
+        """Refresh all aggregates every `interval` seconds until interrupted."""
+        try:
+            while True:
+                self.refresh()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            logger.info("aggregate refresher interrupted by user")
+
+    def _source(self, aggregate: AggregateCnn) -> str:
+        return aggregate.source or self.SRC.stream.ingest_table
+
+    def _rebuild(self, aggregate: AggregateCnn, snapshot: int) -> None:
+        keys = [quote_identifier(key) for key in aggregate.group_by]
+        measures = [f"{full_expression(expression)} AS {quote_identifier(alias)}" for alias, expression in aggregate.measures.items()]
+        group_by = f"GROUP BY {', '.join(keys)}" if keys else ""
+        self.execute(f"DROP TABLE IF EXISTS {aggregate.name};")
+        self.execute(
+            f"CREATE TABLE {aggregate.name} AS SELECT {', '.join(keys + measures + [f'count(*) AS {ROWS_COLUMN}'])} "
+            f"FROM {self._source(aggregate)} AT (VERSION => {int(snapshot)}) {group_by};"
+        )
+
+    def _measures(self, aggregate: AggregateCnn) -> dict[str, str]:
+        measures = {quote_identifier(alias): delta_expression(expression) for alias, expression in aggregate.measures.items()}
+        measures[ROWS_COLUMN] = f"sum({CHANGE_SIGN})"
+        return measures
+
+    def _delta(self, aggregate: AggregateCnn, start: int, end: int) -> pa.Table:
+        """Signed per-group changes of the source between two snapshots (no rows when nothing changed)."""
+        keys = [quote_identifier(key) for key in aggregate.group_by]
+        group_by = f"GROUP BY {', '.join(keys)}" if keys else ""
+        columns = keys + [f"{expression} AS {alias}" for alias, expression in self._measures(aggregate).items()]
+        # HAVING drops the single all-NULL row an ungrouped aggregate returns over no changes
+        return self.execute(
+            f"SELECT {', '.join(columns)} FROM {self.DEST.catalog.lake_alias}.table_changes('{self._source(aggregate)}', {start}, {end}) "
+            f"{group_by} HAVING count(*) > 0"
+        ).fetch_arrow_table()
+
+    def _apply_delta(self, aggregate: AggregateCnn, delta: pa.Table) -> None:
+        keys = [quote_identifier(key) for key in aggregate.group_by]
+        measures = self._measures(aggregate)
+        self.duckdb_connection.register("mv_delta", delta)
+        try:
+            matches = " AND ".join(f"s.{key} IS NOT DISTINCT FROM d.{key}" for key in keys) or "TRUE"
+            # NULL-safe on both sides, summary tables written before sums were coalesced may hold NULLs
+            assignments = ", ".join(f"{alias} = coalesce(s.{alias}, 0) + coalesce(d.{alias}, 0)" for alias in measures)
+            self.execute(f"UPDATE {aggregate.name} AS s SET {assignments} FROM mv_delta AS d WHERE {matches};")
+            self.execute(
+                f"INSERT INTO {aggregate.name} BY NAME SELECT d.* FROM mv_delta AS d "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {aggregate.name} AS s WHERE {matches});"
+            )
+            self.execute(f"DELETE FROM {aggregate.name} WHERE {ROWS_COLUMN} <= 0;")
+        finally:
+            self.duckdb_connection.unregister("mv_delta")
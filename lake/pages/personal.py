@@ -24,8 +24,9 @@ class Connector(DuckLakeManager):
         # connect to your storage src (no need to call use {alias} command since ducklake automatically detects from scope)
         read_from_src_storage = f"select count(request_id) as num_requests,remote_ip as address from read_parquet('s3://{self.SRC.storage.scope}/logs_2024-09-20T00-20.parquet') \
             group by remote_ip;"
-        result = self.duckdb_connection.execute(read_from_src_storage)
-        df = result.df()
+        # served from the result cache until the parquet object (ETag) or the lake snapshot changes
+        result = self.cached_query(read_from_src_storage)
+        df = result.to_pandas()
 
         df.plot(kind = 'bar', x = 'address', y = 'num_requests')
         plt.title(__file__.split('/')[-1])
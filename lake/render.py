@@ -1,50 +1,129 @@
 import panel as pn
-import numpy as np
-import matplotlib.pyplot as plt
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from lake.pages import load_page
+from lake.util.logger import logger
 ignore = ['__pycache__','__init__.py']
 available_modules = [filename.replace('.py','') for filename in os.listdir('./lake/pages/') if filename not in ignore]
+CONFIG_PATH = 'resources/config.tmp.yml'
+PAGE_CACHE_TTL = float(os.getenv(key="PAGE_CACHE_TTL", default=300))
 
 
 # Ensure the Panel extension is loaded
 pn.extension('ipywidgets')
 
-# Function to render a dashboard
-def render_dashboard(module_name):
-    """Render the dashboard with the given name."""
-    print(f"LOADING MODULE {module_name}")
-    instance = load_page(module_name,'resources/config.tmp.yml')
-    plot = instance.deploy()
-    dashboard = pn.Column(pn.pane.Matplotlib(plot, tight=True), width=600)
-    return dashboard
+
+class PageCache:
+    """
+    Render dashboard pages on first selection and keep the rendered pane.
+    A cached page is re-checked once it is older than `ttl` seconds and only re-rendered
+    when the result-cache key of one of its cached_query() calls changed, i.e. when the lake
+    tables or s3 objects it reads changed (pages that do not query through the cache are
+    re-rendered on every check). Rendering runs on a single
+    background worker (pages draw through pyplot's global state), so the UI never waits on a query.
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._instances = {}
+        self._entries = {}
+        self._pending = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-render")
+
+    def listen(self, callback):
+        """Register callback(name, pane), called whenever a page finished (re-)rendering."""
+        self._listeners.append(callback)
+
+    def get(self, name: str):
+        """Return the cached pane of a page (or a placeholder) and schedule a refresh when it is stale."""
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None or time.monotonic() - entry[1] >= self.ttl:
+            self.refresh(name)
+        if entry is None:
+            return pn.pane.Markdown(f"### loading {name} ...")
+        return entry[0]
+
+    def refresh(self, name: str):
+        with self._lock:
+            if name in self._pending:
+                return
+            self._pending.add(name)
+        self._executor.submit(self._render, name)
+
+    def _render(self, name: str):
+        try:
+            instance = self._instances.get(name)
+            if instance is None:
+                logger.info(f"LOADING MODULE {name}")
+                instance = self._instances[name] = load_page(name, CONFIG_PATH)
+            with self._lock:
+                entry = self._entries.get(name)
+            if entry is not None and instance.cached_queries_changed() is False:
+                # none of the data the page was rendered from changed
+                with self._lock:
+                    self._entries[name] = (entry[0], time.monotonic())
+                return
+            started = time.perf_counter()
+            instance.reset_cached_queries()
+            plot = instance.deploy()
+            pane = pn.Column(pn.pane.Matplotlib(plot, tight=True), width=600)
+            logger.info(f"rendered page {name} in {time.perf_counter() - started:.2f}s")
+            with self._lock:
+                self._entries[name] = (pane, time.monotonic())
+            for callback in self._listeners:
+                callback(name, pane)
+        except Exception as fail:
+            logger.error(f"failed to render page {name}: {fail}")
+        finally:
+            with self._lock:
+                self._pending.discard(name)
+
+    def start_refresher(self):
+        """Periodically refresh every page that was rendered once, independent of user activity."""
+        def refresh_loop():
+            while True:
+                time.sleep(self.ttl)
+                with self._lock:
+                    names = list(self._entries)
+                for name in names:
+                    self.refresh(name)
+        threading.Thread(target=refresh_loop, name="page-refresher", daemon=True).start()
+
+
+page_cache = PageCache(PAGE_CACHE_TTL)
 
 # Sidebar with navigation
 sidebar = pn.widgets.Select(name='Select Dashboard', options=available_modules)
 
-# Creating initial dashboards
-dashboards = {name: render_dashboard(name) for name in sidebar.options}
-
 # Function to update the displayed dashboard
 def view_dashboard(event):
     selected_dashboard = event.new
-    dashboard_panel[:] = [dashboards[selected_dashboard]]
+    dashboard_panel[:] = [page_cache.get(selected_dashboard)]
 
-# Initial dashboard
-dashboard_panel = pn.Column(dashboards[sidebar.value])
-print("PANEL VALUES",dashboard_panel)
-print("SIDEBAR",sidebar)
+# Swap the placeholder (or a stale pane) once a background render of the shown page finishes
+def on_page_rendered(name, pane):
+    if sidebar.value == name:
+        dashboard_panel[:] = [pane]
+
+# Initial dashboard (rendered in the background, a placeholder is shown meanwhile)
+dashboard_panel = pn.Column(page_cache.get(sidebar.value))
+page_cache.listen(on_page_rendered)
 layout = pn.Row(sidebar, dashboard_panel,height=600, width_policy='max')
 
 def serve():
     sidebar.param.watch(view_dashboard, 'value')
+    page_cache.start_refresher()
 
     # Display the layout
     main_layout = pn.Column(layout)
     main_layout.servable(title='Bi as Code panel')
     print(f"serving {main_layout}")
     pn.serve(main_layout)
-    
+
 # Run the app
 if __name__ == '__main__':
-    serve()
\ No newline at end of file
+    serve()
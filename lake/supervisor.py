@@ -0,0 +1,133 @@
+import multiprocessing as mp
+import time
+from queue import Empty
+from lake.connector import load_connector
+from lake.util.logger import logger
+from lake.util.metrics import start_metrics_server
+
+
+def _run_worker(config_path: str, stats_queue, metrics_port: int | None = None) -> None:
+    """Entry point of a single ingest process (own Kafka consumer, own DuckDB connection)."""
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    cnn = load_connector("kafka", config_path)
+    cnn.stats_queue = stats_queue
+    cnn.attach()
+
+
+class Supervisor:
+    """
+    Run N Kafka ingest processes in the same consumer group.
+    Kafka spreads the partitions over the workers; the supervisor restarts
+    workers that exit with a failure and logs the aggregated throughput.
+    Restarts of a slot back off exponentially (restart_delay doubling up to max_restart_delay);
+    after max_restarts crashes in a row, e.g. on a poison batch, the slot is given up.
+    A worker that stayed up for max_restart_delay seconds starts counting from zero again.
+    Workers always resume from the offsets stored in the lake; a replay is written
+    there before the supervisor starts (see `Connector.replay_from`).
+    """
+    def __init__(
+        self,
+        config_path: str,
+        workers: int,
+        report_interval: float = 30.0,
+        restart_delay: float = 5.0,
+        metrics_port: int | None = None,
+        max_restart_delay: float = 300.0,
+        max_restarts: int = 10,
+    ):
+        self.config_path = config_path
+        self.metrics_port = metrics_port
+        self.workers = workers
+        self.report_interval = report_interval
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.max_restarts = max_restarts
+        self._ctx = mp.get_context("spawn")
+        self._stats = self._ctx.Queue()
+        self._processes: dict[int, mp.Process] = {}
+        self._rows: dict[int, int] = {}
+        self._started: dict[int, float] = {}
+        self._crashes: dict[int, int] = {}
+        self._restart_at: dict[int, float] = {}
+        self._failed = False
+
+    def _spawn(self, slot: int) -> None:
+        process = self._ctx.Process(
+            target=_run_worker,
+            # each worker exposes its own registry on metrics_port + slot
+            args=(self.config_path, self._stats, self.metrics_port + slot if self.metrics_port else None),
+            name=f"lake-ingest-{slot}",
+        )
+        process.start()
+        self._processes[slot] = process
+        self._started[slot] = time.monotonic()
+        logger.info(f"started ingest worker {slot} (pid={process.pid})")
+
+    def _schedule_restart(self, slot: int, process: mp.Process) -> None:
+        if time.monotonic() - self._started[slot] >= self.max_restart_delay:
+            self._crashes[slot] = 0
+        crashes = self._crashes[slot] = self._crashes.get(slot, 0) + 1
+        if crashes > self.max_restarts:
+            logger.critical(
+                f"ingest worker {slot} (pid={process.pid}) crashed {crashes} times in a row (exit code {process.exitcode}), giving up on it"
+            )
+            self._failed = True
+            return
+        delay = min(self.restart_delay * 2 ** (crashes - 1), self.max_restart_delay)
+        logger.error(
+            f"ingest worker {slot} (pid={process.pid}) crashed with exit code {process.exitcode}, "
+            f"restarting in {delay:.1f}s (restart {crashes}/{self.max_restarts})"
+        )
+        self._restart_at[slot] = time.monotonic() + delay
+
+    def _collect_stats(self) -> None:
+        while True:
+            try:
+                pid, rows, _ = self._stats.get_nowait()
+            except Empty:
+                return
+            self._rows[pid] = self._rows.get(pid, 0) + rows
+
+    def _report(self, elapsed: float) -> None:
+        total = sum(self._rows.values())
+        per_worker = ", ".join(f"pid {pid}: {rows / elapsed:.0f}" for pid, rows in self._rows.items())
+        logger.info(f"ingest throughput {total / elapsed:.0f} msgs/sec over {len(self._processes)} workers ({per_worker})")
+        self._rows.clear()
+
+    def run(self) -> None:
+        for slot in range(self.workers):
+            self._spawn(slot)
+        window_start = time.monotonic()
+        try:
+            while True:
+                time.sleep(1.0)
+                self._collect_stats()
+                for slot, process in list(self._processes.items()):
+                    if process.is_alive():
+                        continue
+                    del self._processes[slot]
+                    if process.exitcode == 0:
+                        logger.info(f"ingest worker {slot} (pid={process.pid}) finished")
+                        continue
+                    self._schedule_restart(slot, process)
+                now = time.monotonic()
+                for slot, restart_at in list(self._restart_at.items()):
+                    if now >= restart_at:
+                        del self._restart_at[slot]
+                        self._spawn(slot)
+                if not self._processes and not self._restart_at:
+                    if self._failed:
+                        raise SystemExit(1)
+                    return
+                elapsed = time.monotonic() - window_start
+                if elapsed >= self.report_interval:
+                    self._report(elapsed)
+                    window_start = time.monotonic()
+        except KeyboardInterrupt:
+            logger.info("supervisor interrupted by user, stopping workers")
+        finally:
+            for process in self._processes.values():
+                process.join(timeout=30)
+                if process.is_alive():
+                    process.terminate()
@@ -0,0 +1,455 @@
+import abc
+import io
+import json
+import os
+import struct
+import uuid
+from typing import Any, Optional
+import pandas as pd
+import pyarrow as pa
+from lake.util.conf_loader import FormatCnn
+from lake.util.logger import logger
+
+try:
+    import fastavro
+except ImportError:  # optional, only needed for format: avro
+    fastavro = None
+try:
+    from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+    from google.protobuf.descriptor import FieldDescriptor
+except ImportError:  # optional, only needed for format: protobuf
+    descriptor_pool = None
+try:
+    import msgpack
+except ImportError:  # optional, only needed for format: msgpack
+    msgpack = None
+
+DECODERS: dict[str, type["BatchDecoder"]] = {}
+# a "null"-only avro field has no useful type, it is kept as a string column like empty JSON fields
+AVRO_PRIMITIVES = {
+    "null": pa.string(),
+    "boolean": pa.bool_(),
+    "int": pa.int32(),
+    "long": pa.int64(),
+    "float": pa.float32(),
+    "double": pa.float64(),
+    "bytes": pa.binary(),
+    "string": pa.string(),
+}
+AVRO_LOGICAL_TYPES = {
+    "timestamp-millis": pa.timestamp("ms", tz="UTC"),
+    "timestamp-micros": pa.timestamp("us", tz="UTC"),
+    "date": pa.date32(),
+    "time-millis": pa.time32("ms"),
+    "time-micros": pa.time64("us"),
+    "local-timestamp-millis": pa.timestamp("ms"),
+    "local-timestamp-micros": pa.timestamp("us"),
+    # fastavro reads uuids as uuid.UUID, avro_value turns them into the mapped strings
+    "uuid": pa.string(),
+}
+
+
+def register_decoder(name: str):
+    """Make a BatchDecoder subclass selectable as `format: name` in stream.formats."""
+    def register(decoder: type["BatchDecoder"]) -> type["BatchDecoder"]:
+        DECODERS[name] = decoder
+        return decoder
+    return register
+
+
+def make_decoder(settings: FormatCnn) -> Optional["BatchDecoder"]:
+    """Build the decoder of a stream.formats entry; JSON (None) stays with the connector's own arrow/pandas path."""
+    if settings.format == "json":
+        return None
+    if settings.format not in DECODERS:
+        raise ValueError(f"unknown payload format {settings.format!r} (expected json or one of {sorted(DECODERS)})")
+    return DECODERS[settings.format](settings)
+
+
+def strings_for_null_columns(table: pa.Table) -> pa.Table:
+    """Fields that are null in the whole batch carry no type; keep them as strings rather than guessing."""
+    for index, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(index, field.name, table.column(index).cast(pa.string()))
+    return table
+
+
+def records_table(rows: list[dict]) -> pa.Table:
+    """
+    Arrow table of decoded records whose types are not known up front, nested objects kept as structs
+    like the arrow JSON reader does. Columns are the union of the records' fields; fields that are null
+    in every row are typed as strings and fields whose values conflict in type are kept as strings
+    (JSON for objects) instead of failing the whole batch.
+    """
+    columns = {}
+    for name in dict.fromkeys(name for row in rows for name in row):
+        values = [row.get(name) for row in rows]
+        try:
+            columns[name] = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            columns[name] = pa.array(
+                [value if value is None or isinstance(value, str) else json.dumps(value, default=str) for value in values],
+                pa.string(),
+            )
+    return strings_for_null_columns(pa.table(columns))
+
+
+def split_frame(payload: bytes, framing: str) -> tuple[Optional[int], bytes]:
+    """Strip the schema registry wire format (magic byte 0, 4-byte big-endian schema id) when `framing` is confluent."""
+    if framing != "confluent":
+        return None, payload
+    if len(payload) < 5 or payload[0] != 0:
+        raise ValueError("payload is not framed with a schema id (magic byte 0 + 4 bytes)")
+    return struct.unpack(">I", payload[1:5])[0], payload[5:]
+
+
+def read_varint(body: bytes, position: int) -> tuple[int, int]:
+    """Read a zigzag-encoded varint at `position`; returns (value, next position)."""
+    shift, result = 0, 0
+    while True:
+        byte = body[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return (result >> 1) ^ -(result & 1), position
+        shift += 7
+
+
+def message_indexes(body: bytes) -> tuple[tuple[int, ...], bytes]:
+    """Read the protobuf message-index path that follows the schema id ([0], the first message, is sent as a single 0)."""
+    count, position = read_varint(body, 0)
+    if count == 0:
+        return (0,), body[position:]
+    indexes = []
+    for _ in range(count):
+        index, position = read_varint(body, position)
+        indexes.append(index)
+    return tuple(indexes), body[position:]
+
+
+class BatchDecoder(abc.ABC):
+    """
+    Turns the raw payloads of one topic into one Arrow table, a row per decoded payload.
+    Subclasses registered with @register_decoder("name") become selectable per topic in stream.formats.
+    """
+    def __init__(self, settings: FormatCnn):
+        self.settings = settings
+
+    @abc.abstractmethod
+    def decode(self, payloads: list[bytes]) -> tuple[pa.Table | pd.DataFrame | None, list[int]]:
+        """Decode a batch; also returns the indices of the payloads that made it into the frame."""
+
+    @abc.abstractmethod
+    def decode_one(self, payload: bytes) -> dict:
+        """Decode a single payload into a record (single-message ingest)."""
+
+
+class RecordDecoder(BatchDecoder):
+    """
+    Base of binary formats that are read message by message and assembled into Arrow in one step,
+    with column types taken from the writer schema (arrow_schema) rather than inferred from the values.
+    Schemas come from `schema_file`, or per schema id from `registry_directory` (a local stand-in for a
+    schema registry holding one {id}{suffix} file per schema); decoders cache what they derive per id.
+    """
+    suffix = ""
+
+    def decode(self, payloads: list[bytes]) -> tuple[pa.Table | pd.DataFrame | None, list[int]]:
+        records, kept, schema_keys = [], [], {}
+        for index, payload in enumerate(payloads):
+            try:
+                schema_key, record = self.read(payload)
+            except Exception as fail:
+                logger.critical(f"failed to decode {self.settings.format} message: {payload[:64]!r} {fail}")
+                continue
+            records.append(record)
+            kept.append(index)
+            schema_keys[schema_key] = None
+        if not records:
+            return None, kept
+        schema = self.arrow_schema(list(schema_keys))
+        if schema is not None:
+            try:
+                return pa.Table.from_pylist(records, schema=schema), kept
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as fail:
+                logger.warning(f"{self.settings.format} values do not match the writer schema's arrow types, inferring them: {fail}")
+        return records_table(records), kept
+
+    def decode_one(self, payload: bytes) -> dict:
+        return self.read(payload)[1]
+
+    @abc.abstractmethod
+    def read(self, payload: bytes) -> tuple[Any, dict]:
+        """Decode one payload into (schema key, record)."""
+
+    def arrow_schema(self, schema_keys: list) -> Optional[pa.Schema]:
+        """Arrow schema of records read with `schema_keys`, None to infer it from the records."""
+        return None
+
+    def schema_path(self, schema_id: Optional[int]) -> str:
+        if schema_id is not None and self.settings.registry_directory:
+            return os.path.join(self.settings.registry_directory, f"{schema_id}{self.suffix}")
+        if self.settings.schema_file:
+            return self.settings.schema_file
+        raise ValueError(f"no schema for id {schema_id} of {self.settings.topic}: set schema_file or registry_directory")
+
+    @staticmethod
+    def unify(schemas: list[Optional[pa.Schema]]) -> Optional[pa.Schema]:
+        if not schemas or any(schema is None for schema in schemas):
+            return None
+        try:
+            return pa.unify_schemas(schemas, promote_options="permissive")
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return None
+
+
+def avro_arrow_type(schema, named: dict[str, pa.DataType]) -> pa.DataType:
+    if isinstance(schema, str):
+        return AVRO_PRIMITIVES[schema] if schema in AVRO_PRIMITIVES else named[schema]
+    if isinstance(schema, list):
+        branches = [branch for branch in schema if branch != "null"]
+        if len(branches) != 1:
+            raise ValueError(f"unions of several types are not supported: {schema}")
+        return avro_arrow_type(branches[0], named)
+    logical = schema.get("logicalType")
+    if logical == "decimal":
+        return pa.decimal128(schema["precision"], schema.get("scale", 0))
+    if logical in AVRO_LOGICAL_TYPES:
+        return AVRO_LOGICAL_TYPES[logical]
+    kind = schema["type"]
+    if kind == "record":
+        arrow_type = pa.struct([pa.field(field["name"], avro_arrow_type(field["type"], named)) for field in schema["fields"]])
+    elif kind == "enum":
+        arrow_type = pa.string()
+    elif kind == "fixed":
+        arrow_type = pa.binary(schema["size"])
+    elif kind == "array":
+        return pa.list_(avro_arrow_type(schema["items"], named))
+    elif kind == "map":
+        return pa.map_(pa.string(), avro_arrow_type(schema["values"], named))
+    else:
+        return avro_arrow_type(kind, named)
+    named[schema["name"]] = arrow_type
+    if schema.get("namespace"):
+        named[f"{schema['namespace']}.{schema['name']}"] = arrow_type
+    return arrow_type
+
+
+def avro_logical_types(schema) -> set[str]:
+    """Logical types used anywhere in an Avro schema."""
+    if isinstance(schema, list):
+        return set().union(*(avro_logical_types(branch) for branch in schema))
+    if not isinstance(schema, dict):
+        return set()
+    found = {schema["logicalType"]} if "logicalType" in schema else set()
+    for field in schema.get("fields", []):
+        found |= avro_logical_types(field["type"])
+    for key in ("items", "values"):
+        if key in schema:
+            found |= avro_logical_types(schema[key])
+    if isinstance(schema.get("type"), (dict, list)):
+        found |= avro_logical_types(schema["type"])
+    return found
+
+
+def avro_value(value):
+    """Convert the values fastavro reads for logical types that are mapped to another Arrow type (uuid -> string)."""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: avro_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [avro_value(item) for item in value]
+    return value
+
+
+def avro_arrow_schema(definition) -> Optional[pa.Schema]:
+    """Arrow schema of a top-level Avro record, None when it cannot be mapped (types are then inferred)."""
+    try:
+        record = avro_arrow_type(definition, {})
+    except (KeyError, ValueError) as fail:
+        logger.warning(f"cannot map avro schema to arrow ({fail}), column types are inferred per batch")
+        return None
+    if not pa.types.is_struct(record):
+        return None
+    return pa.schema([record.field(index) for index in range(record.num_fields)])
+
+
+@register_decoder("avro")
+class AvroDecoder(RecordDecoder):
+    """Avro records (fastavro), writer schemas from {id}.avsc files or schema_file."""
+    suffix = ".avsc"
+
+    def __init__(self, settings: FormatCnn):
+        if fastavro is None:
+            raise ImportError("format avro needs fastavro (pip install fastavro)")
+        super().__init__(settings)
+        self._schemas: dict[Optional[int], tuple[Any, Optional[pa.Schema], bool]] = {}
+
+    def _schema(self, schema_id: Optional[int]) -> tuple[Any, Optional[pa.Schema], bool]:
+        cached = self._schemas.get(schema_id)
+        if cached is None:
+            with open(self.schema_path(schema_id)) as schema_file:
+                definition = json.load(schema_file)
+            cached = (fastavro.parse_schema(definition), avro_arrow_schema(definition), "uuid" in avro_logical_types(definition))
+            self._schemas[schema_id] = cached
+        return cached
+
+    def read(self, payload: bytes) -> tuple[Any, dict]:
+        schema_id, body = split_frame(payload, self.settings.framing)
+        parsed, _, has_uuid = self._schema(schema_id)
+        record = fastavro.schemaless_reader(io.BytesIO(body), parsed)
+        if not isinstance(record, dict):
+            raise ValueError(f"expected a record, got {type(record).__name__}")
+        return schema_id, avro_value(record) if has_uuid else record
+
+    def arrow_schema(self, schema_keys: list) -> Optional[pa.Schema]:
+        return self.unify([self._schema(schema_id)[1] for schema_id in schema_keys])
+
+
+def proto_is_repeated(field) -> bool:
+    # FieldDescriptor.label was replaced by is_repeated in recent protobuf releases
+    is_repeated = getattr(field, "is_repeated", None)
+    return is_repeated if is_repeated is not None else field.label == FieldDescriptor.LABEL_REPEATED
+
+
+def proto_is_map(field) -> bool:
+    return field.message_type is not None and field.message_type.GetOptions().map_entry
+
+
+def proto_arrow_type(field, path: tuple[str, ...]) -> pa.DataType:
+    if proto_is_map(field):
+        key, value = field.message_type.fields_by_name["key"], field.message_type.fields_by_name["value"]
+        return pa.map_(proto_arrow_type(key, path), proto_arrow_type(value, path))
+    if field.type == FieldDescriptor.TYPE_MESSAGE:
+        item = proto_arrow_struct(field.message_type, path)
+    elif field.type == FieldDescriptor.TYPE_ENUM:
+        item = pa.string()
+    else:
+        item = {
+            FieldDescriptor.TYPE_DOUBLE: pa.float64(),
+            FieldDescriptor.TYPE_FLOAT: pa.float32(),
+            FieldDescriptor.TYPE_INT64: pa.int64(),
+            FieldDescriptor.TYPE_SINT64: pa.int64(),
+            FieldDescriptor.TYPE_SFIXED64: pa.int64(),
+            FieldDescriptor.TYPE_UINT64: pa.uint64(),
+            FieldDescriptor.TYPE_FIXED64: pa.uint64(),
+            FieldDescriptor.TYPE_INT32: pa.int32(),
+            FieldDescriptor.TYPE_SINT32: pa.int32(),
+            FieldDescriptor.TYPE_SFIXED32: pa.int32(),
+            FieldDescriptor.TYPE_UINT32: pa.uint32(),
+            FieldDescriptor.TYPE_FIXED32: pa.uint32(),
+            FieldDescriptor.TYPE_BOOL: pa.bool_(),
+            FieldDescriptor.TYPE_STRING: pa.string(),
+            FieldDescriptor.TYPE_BYTES: pa.binary(),
+        }[field.type]
+    return pa.list_(item) if proto_is_repeated(field) else item
+
+
+def proto_arrow_struct(descriptor, path: tuple[str, ...] = ()) -> pa.StructType:
+    if descriptor.full_name in path:
+        raise ValueError(f"recursive message type {descriptor.full_name} is not supported")
+    path = path + (descriptor.full_name,)
+    return pa.struct([pa.field(field.name, proto_arrow_type(field, path)) for field in descriptor.fields])
+
+
+def proto_value(field, value):
+    if field.type == FieldDescriptor.TYPE_MESSAGE:
+        return proto_record(value)
+    if field.type == FieldDescriptor.TYPE_ENUM:
+        enum_value = field.enum_type.values_by_number.get(value)
+        return enum_value.name if enum_value is not None else str(value)
+    return value
+
+
+def proto_record(message) -> dict:
+    """Convert a message into a record that matches proto_arrow_struct (enums by name, unset optional fields as None)."""
+    record = {}
+    for field in message.DESCRIPTOR.fields:
+        value = getattr(message, field.name)
+        if proto_is_map(field):
+            value_field = field.message_type.fields_by_name["value"]
+            record[field.name] = [(key, proto_value(value_field, item)) for key, item in value.items()]
+        elif proto_is_repeated(field):
+            record[field.name] = [proto_value(field, item) for item in value]
+        elif field.has_presence and not message.HasField(field.name):
+            record[field.name] = None
+        else:
+            record[field.name] = proto_value(field, value)
+    return record
+
+
+@register_decoder("protobuf")
+class ProtobufDecoder(RecordDecoder):
+    """
+    Protobuf messages described by a descriptor set (protoc --include_imports --descriptor_set_out=...)
+    in {id}.desc files or schema_file. `message_type` names the message; without it, the message-index
+    path of the schema registry framing picks it in the last file of the set (the first message by default).
+    """
+    suffix = ".desc"
+
+    def __init__(self, settings: FormatCnn):
+        if descriptor_pool is None:
+            raise ImportError("format protobuf needs protobuf (pip install protobuf)")
+        super().__init__(settings)
+        self._pools: dict[Optional[int], tuple[Any, Any]] = {}
+        self._messages: dict[tuple[Optional[int], tuple[int, ...]], tuple[type, pa.Schema]] = {}
+
+    def _pool(self, schema_id: Optional[int]) -> tuple[Any, Any]:
+        loaded = self._pools.get(schema_id)
+        if loaded is None:
+            files = descriptor_pb2.FileDescriptorSet()
+            with open(self.schema_path(schema_id), "rb") as schema_file:
+                files.ParseFromString(schema_file.read())
+            pool = descriptor_pool.DescriptorPool()
+            for file in files.file:
+                pool.Add(file)
+            loaded = (pool, files.file[-1])
+            self._pools[schema_id] = loaded
+        return loaded
+
+    def _message(self, schema_id: Optional[int], indexes: tuple[int, ...]) -> tuple[type, pa.Schema]:
+        cached = self._messages.get((schema_id, indexes))
+        if cached is None:
+            pool, main_file = self._pool(schema_id)
+            if self.settings.message_type:
+                descriptor = pool.FindMessageTypeByName(self.settings.message_type)
+            else:
+                name = main_file.message_type[indexes[0]].name
+                descriptor = pool.FindMessageTypeByName(f"{main_file.package}.{name}" if main_file.package else name)
+                for index in indexes[1:]:
+                    descriptor = descriptor.nested_types[index]
+            struct_type = proto_arrow_struct(descriptor)
+            cached = (
+                message_factory.GetMessageClass(descriptor),
+                pa.schema([struct_type.field(index) for index in range(struct_type.num_fields)]),
+            )
+            self._messages[(schema_id, indexes)] = cached
+        return cached
+
+    def read(self, payload: bytes) -> tuple[Any, dict]:
+        schema_id, body = split_frame(payload, self.settings.framing)
+        indexes = (0,)
+        if schema_id is not None:
+            indexes, body = message_indexes(body)
+        message_class, _ = self._message(schema_id, indexes)
+        return (schema_id, indexes), proto_record(message_class.FromString(body))
+
+    def arrow_schema(self, schema_keys: list) -> Optional[pa.Schema]:
+        return self.unify([self._message(*key)[1] for key in schema_keys])
+
+
+@register_decoder("msgpack")
+class MessagePackDecoder(RecordDecoder):
+    """MessagePack maps; msgpack carries no schema, so column types are inferred per batch like JSON."""
+
+    def __init__(self, settings: FormatCnn):
+        if msgpack is None:
+            raise ImportError("format msgpack needs msgpack (pip install msgpack)")
+        super().__init__(settings)
+
+    def read(self, payload: bytes) -> tuple[Any, dict]:
+        _, body = split_frame(payload, self.settings.framing)
+        record = msgpack.unpackb(body, raw=False, timestamp=3)
+        if not isinstance(record, dict):
+            raise ValueError(f"expected a map, got {type(record).__name__}")
+        return None, record
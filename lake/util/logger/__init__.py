@@ -1 +1,2 @@
-from .setup import logger
\ No newline at end of file
+from .setup import logger, log_to_stderr
+from .sampler import LogSampler
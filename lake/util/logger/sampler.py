@@ -0,0 +1,48 @@
+import time
+from logging import INFO, Logger
+
+
+class LogSampler:
+	"""
+	Aggregate hot-path events (polls, decodes, inserts) into one summary line
+	emitted every `every` events or `interval` seconds, whichever comes first.
+	Nothing is formatted unless the summary is actually emitted at an enabled level.
+	"""
+	def __init__(self, logger: Logger, name: str, every: int = 10, interval: float = 60.0, level: int = INFO):
+		self.logger = logger
+		self.name = name
+		self.every = every
+		self.interval = interval
+		self.level = level
+		self._reset()
+
+	def _reset(self) -> None:
+		self.events = 0
+		self.messages = 0
+		self.bytes = 0
+		self.latency = 0.0
+		self.max_latency = 0.0
+		self.started = time.monotonic()
+
+	def record(self, messages: int = 1, nbytes: int = 0, latency: float = 0.0) -> bool:
+		"""Account one event; returns True when this call emitted a summary."""
+		self.events += 1
+		self.messages += messages
+		self.bytes += nbytes
+		self.latency += latency
+		self.max_latency = max(self.max_latency, latency)
+		if self.events >= self.every or time.monotonic() - self.started >= self.interval:
+			self.flush()
+			return True
+		return False
+
+	def flush(self) -> None:
+		if self.events and self.logger.isEnabledFor(self.level):
+			elapsed = max(time.monotonic() - self.started, 1e-9)
+			self.logger.log(
+				self.level,
+				"%s: %d batches, %d messages, %d bytes in %.1fs (%.0f msgs/sec), latency avg %.1f ms max %.1f ms",
+				self.name, self.events, self.messages, self.bytes, elapsed, self.messages / elapsed,
+				1000 * self.latency / self.events, 1000 * self.max_latency,
+			)
+		self._reset()
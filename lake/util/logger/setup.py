@@ -1,6 +1,7 @@
 import logging.config as logconf
 import os
-from logging import Logger, getLogger
+import sys
+from logging import Logger, StreamHandler, getLogger
 
 import yaml
 
@@ -18,4 +19,14 @@ def setup_logging() -> Logger:
 	return getLogger(logger_name)
 
 
+def log_to_stderr(logger: Logger) -> None:
+	"""
+	Move console handlers from stdout to stderr.
+	Used by commands that write their data to stdout.
+	"""
+	for handler in logger.handlers + getLogger().handlers:
+		if isinstance(handler, StreamHandler) and handler.stream is sys.stdout:
+			handler.setStream(sys.stderr)
+
+
 logger = setup_logging()
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import PurePosixPath
+from lake.util.logger import logger
+from lake.util.metrics import registry
+
+OBJECT_LOOKUPS = registry.counter("lake_object_cache_lookups_total", "Local S3 object cache lookups by outcome", ("outcome",))
+OBJECT_CACHE_BYTES = registry.gauge("lake_object_cache_bytes", "Bytes held by the local S3 object cache", ("directory",))
+
+
+class ObjectCache:
+    """
+    Read-through copy of S3 objects on local disk, bounded by bytes with LRU eviction.
+    Files are named after bucket, key and ETag, so an overwritten object is downloaded again
+    and its stale copy ages out. Recency is kept in the file mtime, so the cache survives restarts.
+    Files used in the last `grace` seconds are never evicted (a query may be about to open them),
+    so the cache can exceed max_bytes for a while when a single scan needs more than that.
+    """
+    def __init__(self, directory: str, max_bytes: int, grace: float = 300.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self._files: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with os.scandir(directory) as listing:
+            files = [(entry.stat().st_mtime, entry.path, entry.stat().st_size) for entry in listing if not entry.name.endswith(".tmp")]
+        for used, path, size in sorted(files):
+            self._files[path] = (size, used)
+            self._bytes += size
+        OBJECT_CACHE_BYTES.set(self._bytes, directory=directory)
+
+    def _path(self, bucket: str, key: str, etag: str) -> str:
+        digest = hashlib.sha256(f"{bucket}/{key}/{etag}".encode()).hexdigest()
+        # keep the suffix, DuckDB picks readers and compression from it
+        return os.path.join(self.directory, digest + "".join(PurePosixPath(key).suffixes[-2:]))
+
+    def get(self, client, bucket: str, key: str, etag: str) -> str:
+        """Return the local path of s3://bucket/key at `etag`, downloading it on a miss."""
+        path = self._path(bucket, key, etag)
+        with self._lock:
+            hit = path in self._files
+            if hit:
+                self._files[path] = (self._files[path][0], time.time())
+                self._files.move_to_end(path)
+        if hit and os.path.exists(path):
+            OBJECT_LOOKUPS.inc(outcome="hit")
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+        OBJECT_LOOKUPS.inc(outcome="miss")
+        partial = f"{path}.{threading.get_ident()}.tmp"
+        client.download_file(bucket, key, partial)
+        os.replace(partial, path)
+        self._add(path, os.path.getsize(path))
+        return path
+
+    def _add(self, path: str, size: int) -> None:
+        evicted = []
+        with self._lock:
+            self._bytes += size - self._files.pop(path, (0, 0.0))[0]
+            self._files[path] = (size, time.time())
+            while self._bytes > self.max_bytes:
+                old_path, (old_size, used) = next(iter(self._files.items()))
+                if time.time() - used < self.grace:
+                    break
+                del self._files[old_path]
+                self._bytes -= old_size
+                evicted.append(old_path)
+            OBJECT_CACHE_BYTES.set(self._bytes, directory=self.directory)
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError as fail:
+                logger.debug(f"cannot evict cached object {old_path}: {fail}")
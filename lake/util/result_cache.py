@@ -0,0 +1,99 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+import pyarrow as pa
+from lake.util.logger import logger
+from lake.util.metrics import registry
+
+CACHE_LOOKUPS = registry.counter("lake_result_cache_lookups_total", "Query result cache lookups by outcome", ("outcome",))
+
+
+class ResultCache:
+    """
+    LRU cache of Arrow query results bounded by in-memory bytes.
+    With a spill directory, entries evicted from memory are kept as Arrow IPC files
+    (memory-mapped back on a hit) until the directory exceeds spill_max_bytes.
+    """
+    def __init__(self, max_bytes: int, spill_directory: Optional[str] = None, spill_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.spill_directory = spill_directory
+        self.spill_max_bytes = spill_max_bytes
+        self._entries: OrderedDict[str, pa.Table] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if spill_directory:
+            os.makedirs(spill_directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[pa.Table]:
+        with self._lock:
+            table = self._entries.get(key)
+            if table is not None:
+                self._entries.move_to_end(key)
+                CACHE_LOOKUPS.inc(outcome="memory")
+                return table
+        table = self._load_spilled(key)
+        if table is not None:
+            CACHE_LOOKUPS.inc(outcome="spill")
+            return table
+        CACHE_LOOKUPS.inc(outcome="miss")
+        return None
+
+    def put(self, key: str, table: pa.Table) -> None:
+        if table.nbytes > self.max_bytes:
+            self._spill(key, table)
+            return
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = table
+            self._bytes += table.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_table = self._entries.popitem(last=False)
+                self._bytes -= old_table.nbytes
+                evicted.append((old_key, old_table))
+        for old_key, old_table in evicted:
+            self._spill(old_key, old_table)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.spill_directory, f"{key}.arrow")
+
+    def _spill(self, key: str, table: pa.Table) -> None:
+        if not self.spill_directory:
+            return
+        path = self._path(key)
+        try:
+            with pa.OSFile(path + ".tmp", "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(path + ".tmp", path)
+        except OSError as fail:
+            logger.warning(f"cannot spill cached result {key}: {fail}")
+            return
+        self._trim_spill()
+
+    def _load_spilled(self, key: str) -> Optional[pa.Table]:
+        if not self.spill_directory:
+            return None
+        path = self._path(key)
+        try:
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            os.utime(path)
+        except (OSError, pa.ArrowInvalid):
+            return None
+        return table
+
+    def _trim_spill(self) -> None:
+        """Drop least recently used spill files until the directory fits spill_max_bytes."""
+        with os.scandir(self.spill_directory) as listing:
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in listing if entry.name.endswith(".arrow")]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.spill_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+import yaml
+
+# lake.util.logger configures logging on import; the default config also logs to resources/logs/,
+# which only exists in deployments, so tests log to the console only
+if "LOG_CONFIG_FILE" not in os.environ:
+    config = {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "handlers": {"console": {"class": "logging.StreamHandler", "level": "WARNING"}},
+        "loggers": {"development": {"level": "DEBUG", "handlers": ["console"], "propagate": False}},
+    }
+    with tempfile.NamedTemporaryFile("w", suffix=".yml", delete=False) as config_file:
+        yaml.safe_dump(config, config_file)
+    os.environ["LOG_CONFIG_FILE"] = config_file.name
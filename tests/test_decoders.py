@@ -0,0 +1,198 @@
+import datetime
+import decimal
+import io
+import json
+import struct
+import uuid
+
+import pyarrow as pa
+import pytest
+
+from lake.util.conf_loader import FormatCnn
+from lake.util.decoders import BatchDecoder, RecordDecoder, avro_arrow_type, make_decoder, message_indexes, read_varint
+
+
+def confluent_frame(schema_id: int, body: bytes) -> bytes:
+    return b"\x00" + struct.pack(">I", schema_id) + body
+
+
+@pytest.mark.parametrize(
+    "body, value",
+    [
+        (b"\x00", 0),
+        (b"\x01", -1),
+        (b"\x02", 1),
+        (b"\x03", -2),
+        (b"\xd8\x04", 300),
+        (b"\xd7\x04", -300),
+    ],
+)
+def test_read_varint_decodes_zigzag(body, value):
+    assert read_varint(body, 0) == (value, len(body))
+
+
+def test_read_varint_starts_at_position():
+    body = b"\xff\x02\x04rest"
+    assert read_varint(body, 1) == (1, 2)
+    assert read_varint(body, 2) == (2, 3)
+
+
+def test_read_varint_truncated_body():
+    with pytest.raises(IndexError):
+        read_varint(b"\x80", 0)
+
+
+def test_message_indexes_first_message_shortcut():
+    assert message_indexes(b"\x00payload") == ((0,), b"payload")
+
+
+def test_message_indexes_nested_path():
+    # count 2, then indexes 1 and 3 (all zigzag varints)
+    assert message_indexes(b"\x04\x02\x06payload") == ((1, 3), b"payload")
+
+
+def test_avro_primitives_and_nullable_unions():
+    assert avro_arrow_type("long", {}) == pa.int64()
+    assert avro_arrow_type("null", {}) == pa.string()
+    assert avro_arrow_type(["null", "double"], {}) == pa.float64()
+
+
+def test_avro_unions_of_several_types_are_rejected():
+    with pytest.raises(ValueError):
+        avro_arrow_type(["null", "int", "string"], {})
+
+
+def test_avro_logical_types():
+    assert avro_arrow_type({"type": "long", "logicalType": "timestamp-millis"}, {}) == pa.timestamp("ms", tz="UTC")
+    assert avro_arrow_type({"type": "bytes", "logicalType": "decimal", "precision": 10, "scale": 2}, {}) == pa.decimal128(10, 2)
+
+
+def test_avro_containers():
+    assert avro_arrow_type({"type": "array", "items": "int"}, {}) == pa.list_(pa.int32())
+    assert avro_arrow_type({"type": "map", "values": "string"}, {}) == pa.map_(pa.string(), pa.string())
+    assert avro_arrow_type({"type": "enum", "name": "Kind", "symbols": ["A", "B"]}, {}) == pa.string()
+    assert avro_arrow_type({"type": "fixed", "name": "Hash", "size": 16}, {}) == pa.binary(16)
+
+
+def test_avro_records_register_named_types():
+    named = {}
+    address = {
+        "type": "record",
+        "name": "Address",
+        "namespace": "shop",
+        "fields": [{"name": "city", "type": "string"}],
+    }
+    schema = {
+        "type": "record",
+        "name": "Order",
+        "fields": [
+            {"name": "billing", "type": address},
+            {"name": "shipping", "type": ["null", "shop.Address"]},
+        ],
+    }
+    address_type = pa.struct([pa.field("city", pa.string())])
+    assert avro_arrow_type(schema, named) == pa.struct([pa.field("billing", address_type), pa.field("shipping", address_type)])
+    assert named["Address"] == named["shop.Address"] == address_type
+
+
+def test_decoder_bases_are_abstract():
+    settings = FormatCnn(format="json")
+    with pytest.raises(TypeError):
+        BatchDecoder(settings)
+    with pytest.raises(TypeError):
+        RecordDecoder(settings)
+
+
+ORDER_AVRO = {
+    "type": "record",
+    "name": "Order",
+    "fields": [
+        {"name": "id", "type": {"type": "string", "logicalType": "uuid"}},
+        {"name": "amount", "type": {"type": "bytes", "logicalType": "decimal", "precision": 10, "scale": 2}},
+        {"name": "placed_at", "type": {"type": "long", "logicalType": "timestamp-millis"}},
+        {"name": "note", "type": ["null", "string"], "default": None},
+        {
+            "name": "items",
+            "type": {"type": "array", "items": {"type": "record", "name": "Item", "fields": [{"name": "sku", "type": "string"}]}},
+        },
+    ],
+}
+
+
+def test_avro_round_trip(tmp_path):
+    fastavro = pytest.importorskip("fastavro")
+    (tmp_path / "7.avsc").write_text(json.dumps(ORDER_AVRO))
+    order_id = uuid.uuid4()
+    placed_at = datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    body = io.BytesIO()
+    fastavro.schemaless_writer(
+        body,
+        fastavro.parse_schema(ORDER_AVRO),
+        {"id": str(order_id), "amount": decimal.Decimal("12.50"), "placed_at": placed_at, "note": None, "items": [{"sku": "a-1"}]},
+    )
+    decoder = make_decoder(FormatCnn(format="avro", registry_directory=str(tmp_path), framing="confluent"))
+    table, kept = decoder.decode([confluent_frame(7, body.getvalue()), b"not framed"])
+    assert kept == [0]
+    assert table.schema.field("id").type == pa.string()
+    assert table.schema.field("amount").type == pa.decimal128(10, 2)
+    assert table.to_pylist() == [
+        {"id": str(order_id), "amount": decimal.Decimal("12.50"), "placed_at": placed_at, "note": None, "items": [{"sku": "a-1"}]}
+    ]
+    assert decoder.decode_one(confluent_frame(7, body.getvalue()))["id"] == str(order_id)
+
+
+def order_descriptors():
+    from google.protobuf import descriptor_pb2
+
+    field = descriptor_pb2.FieldDescriptorProto
+    file = descriptor_pb2.FileDescriptorProto(name="orders.proto", package="shop", syntax="proto3")
+    status = file.enum_type.add(name="Status")
+    status.value.add(name="NEW", number=0)
+    status.value.add(name="PAID", number=1)
+    order = file.message_type.add(name="Order")
+    item = order.nested_type.add(name="Item")
+    item.field.add(name="sku", number=1, type=field.TYPE_STRING, label=field.LABEL_OPTIONAL)
+    attrs = order.nested_type.add(name="AttrsEntry")
+    attrs.options.map_entry = True
+    attrs.field.add(name="key", number=1, type=field.TYPE_STRING, label=field.LABEL_OPTIONAL)
+    attrs.field.add(name="value", number=2, type=field.TYPE_STRING, label=field.LABEL_OPTIONAL)
+    order.field.add(name="id", number=1, type=field.TYPE_INT64, label=field.LABEL_OPTIONAL)
+    order.field.add(name="status", number=2, type=field.TYPE_ENUM, type_name=".shop.Status", label=field.LABEL_OPTIONAL)
+    order.field.add(name="tags", number=3, type=field.TYPE_STRING, label=field.LABEL_REPEATED)
+    order.field.add(name="items", number=4, type=field.TYPE_MESSAGE, type_name=".shop.Order.Item", label=field.LABEL_REPEATED)
+    order.field.add(name="attrs", number=5, type=field.TYPE_MESSAGE, type_name=".shop.Order.AttrsEntry", label=field.LABEL_REPEATED)
+    return descriptor_pb2.FileDescriptorSet(file=[file])
+
+
+def test_protobuf_round_trip(tmp_path):
+    pytest.importorskip("google.protobuf")
+    from google.protobuf import descriptor_pool, message_factory
+
+    descriptors = order_descriptors()
+    (tmp_path / "3.desc").write_bytes(descriptors.SerializeToString())
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(descriptors.file[0])
+    order = message_factory.GetMessageClass(pool.FindMessageTypeByName("shop.Order"))(
+        id=42, status=1, tags=["gift"], items=[{"sku": "a-1"}], attrs={"channel": "web"}
+    )
+    decoder = make_decoder(FormatCnn(format="protobuf", registry_directory=str(tmp_path), framing="confluent"))
+    # message index path [0] is sent as a single 0
+    table, kept = decoder.decode([confluent_frame(3, b"\x00" + order.SerializeToString())])
+    assert kept == [0]
+    assert table.schema.field("attrs").type == pa.map_(pa.string(), pa.string())
+    assert table.to_pylist() == [
+        {"id": 42, "status": "PAID", "tags": ["gift"], "items": [{"sku": "a-1"}], "attrs": [("channel", "web")]}
+    ]
+
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+    payloads = [
+        msgpack.packb({"id": 1, "child": {"a": 1}}),
+        msgpack.packb({"id": 2, "extra": "x", "child": {"a": 2}}),
+        msgpack.packb([1, 2]),
+    ]
+    table, kept = make_decoder(FormatCnn(format="msgpack")).decode(payloads)
+    assert kept == [0, 1]
+    assert pa.types.is_struct(table.schema.field("child").type)
+    assert table.to_pylist() == [{"id": 1, "child": {"a": 1}, "extra": None}, {"id": 2, "child": {"a": 2}, "extra": "x"}]
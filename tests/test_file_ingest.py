@@ -0,0 +1,42 @@
+import duckdb
+import pytest
+
+from lake.connector.files import Connector
+from lake.util.conf_loader import DEST, SRC, FileIngestCnn, PgCnn, StorageCnn
+
+
+class LocalFiles(Connector):
+    """Reads a local directory instead of listing and reading SRC.storage."""
+
+    def pending_objects(self, source: FileIngestCnn) -> list[dict]:
+        return self.objects
+
+    def _url(self, item: dict) -> str:
+        return item["Key"]
+
+
+@pytest.fixture
+def connector(tmp_path):
+    connection = duckdb.connect()
+    connection.execute("CREATE TABLE file_manifest (target VARCHAR, bucket VARCHAR, key VARCHAR, etag VARCHAR, size BIGINT, ingested_at TIMESTAMP WITH TIME ZONE)")
+    source = FileIngestCnn(table="events", batch_files=1)
+    cnn = LocalFiles.model_construct(
+        duckdb_connection=connection,
+        SRC=SRC.model_construct(storage=StorageCnn(), files=[source]),
+        DEST=DEST.model_construct(catalog=PgCnn(lake_alias="memory")),
+    )
+    connection.execute(f"COPY (SELECT 1 AS id, 'a' AS name) TO '{tmp_path / 'a.parquet'}'")
+    # a later object with an extra column, in another format
+    (tmp_path / "b.csv").write_text("id,name,extra\n2,b,x\n")
+    (tmp_path / "_SUCCESS").write_text("")
+    object.__setattr__(cnn, "objects", [
+        {"Key": str(tmp_path / name), "ETag": name, "Size": 1} for name in ("a.parquet", "b.csv", "_SUCCESS")
+    ])
+    return cnn, connection
+
+
+def test_mixed_formats_widen_target_and_skip_unknown(connector):
+    cnn, connection = connector
+    cnn.ingest(workers=1)
+    assert connection.execute("SELECT id, name, extra FROM events ORDER BY id").fetchall() == [(1, "a", None), (2, "b", "x")]
+    assert sorted(key.rsplit("/", 1)[1] for (key,) in connection.execute("SELECT key FROM file_manifest").fetchall()) == ["a.parquet", "b.csv"]
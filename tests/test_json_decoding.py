@@ -0,0 +1,33 @@
+import pandas as pd
+import pyarrow as pa
+
+from lake.connector.kafka import Connector
+from lake.util.conf_loader import SRC, BrokerCnn
+
+
+def connector(decoder: str = "arrow") -> Connector:
+    # decoding only needs the stream settings, no lake session or broker
+    stream = BrokerCnn(ingest_table="events", decoder=decoder)
+    return Connector.model_construct(SRC=SRC.model_construct(stream=stream))
+
+
+def test_malformed_message_keeps_nested_shape():
+    payloads = [b'{"id": 1, "child": {"a": 1}}', b'{"id": 2, "child": ', b'{"id": 3, "child": {"a": 3}}']
+    table = connector().decode_batch(payloads)
+    assert isinstance(table, pa.Table)
+    assert table.column_names == ["id", "child"]
+    assert pa.types.is_struct(table.schema.field("child").type)
+    assert table.to_pylist() == [{"id": 1, "child": {"a": 1}}, {"id": 3, "child": {"a": 3}}]
+
+
+def test_conflicting_types_are_kept_as_strings():
+    payloads = [b'{"id": 1, "tag": 5}', b'{"id": 2, "tag": "x", "child": {"a": 1}}', b"not json"]
+    table = connector().decode_batch(payloads)
+    assert table.column("tag").to_pylist() == ["5", "x"]
+    assert pa.types.is_struct(table.schema.field("child").type)
+
+
+def test_pandas_decoder_flattens():
+    frame = connector("pandas").decode_batch([b'{"id": 1, "child": {"a": 1}}'])
+    assert isinstance(frame, pd.DataFrame)
+    assert list(frame.columns) == ["id", "child.a"]
@@ -0,0 +1,51 @@
+import duckdb
+import pytest
+
+from lake.connector.materialize import Connector, delta_expression, full_expression
+from lake.util.conf_loader import AggregateCnn
+
+
+@pytest.fixture
+def summary():
+    # a plain DuckDB connection stands in for the lake: _apply_delta only needs the summary table
+    connection = duckdb.connect()
+    connection.execute("CREATE TABLE totals (g INTEGER, x BIGINT, _mv_rows BIGINT)")
+    connection.execute("INSERT INTO totals VALUES (1, 10, 1)")
+    cnn = Connector.model_construct(duckdb_connection=connection)
+    aggregate = AggregateCnn(name="totals", group_by=["g"], measures={"x": "sum(x)"})
+    return cnn, aggregate, connection
+
+
+def changes(connection: duckdb.DuckDBPyConnection, rows: list[tuple]):
+    """Signed per-group delta of (change_type, g, x) rows, as _delta computes it over table_changes()."""
+    connection.execute("CREATE OR REPLACE TABLE changes (change_type VARCHAR, g INTEGER, x BIGINT)")
+    connection.executemany("INSERT INTO changes VALUES (?, ?, ?)", rows)
+    return connection.execute(
+        f"SELECT g, {delta_expression('sum(x)')} AS x, {delta_expression('count(*)')} AS _mv_rows FROM changes GROUP BY g"
+    ).fetch_arrow_table()
+
+
+def test_all_null_delta_keeps_running_sum(summary):
+    cnn, aggregate, connection = summary
+    cnn._apply_delta(aggregate, changes(connection, [("insert", 1, None)]))
+    assert connection.execute("SELECT * FROM totals").fetchall() == [(1, 10, 2)]
+
+
+def test_null_sum_recovers(summary):
+    cnn, aggregate, connection = summary
+    connection.execute("UPDATE totals SET x = NULL")
+    cnn._apply_delta(aggregate, changes(connection, [("insert", 1, 5), ("insert", 2, None)]))
+    assert connection.execute("SELECT * FROM totals ORDER BY g").fetchall() == [(1, 5, 2), (2, 0, 1)]
+
+
+def test_deletes_subtract(summary):
+    cnn, aggregate, connection = summary
+    cnn._apply_delta(aggregate, changes(connection, [("delete", 1, 10), ("insert", 1, 4)]))
+    assert connection.execute("SELECT * FROM totals").fetchall() == [(1, 4, 1)]
+
+
+def test_full_expression_coalesces_sums_only():
+    assert full_expression("sum(bytes)") == "coalesce(sum(bytes), 0)"
+    assert full_expression("count(*)") == "count(*)"
+    with pytest.raises(ValueError):
+        full_expression("avg(bytes)")
@@ -0,0 +1,81 @@
+import duckdb
+import pytest
+
+from lake.connector.kafka import Connector, partition_transform
+from lake.util.conf_loader import DEST, SRC, BrokerCnn, PgCnn
+
+
+class Recorder:
+    """Data cursor that runs catalog lookups and records the statements that would change the lake."""
+
+    def __init__(self, connection: duckdb.DuckDBPyConnection):
+        self.connection, self.statements = connection, []
+
+    def execute(self, query, parameters=None):
+        if query.startswith("ALTER"):
+            self.statements.append(query)
+            return self
+        return self.connection.execute(query, parameters)
+
+
+@pytest.fixture
+def catalog():
+    # a plain database named like DuckLake's metadata catalog, holding the tables the lookup reads
+    connection = duckdb.connect()
+    connection.execute('ATTACH \':memory:\' AS "__ducklake_metadata_lake"')
+    connection.execute('USE "__ducklake_metadata_lake"')
+    connection.execute("CREATE TABLE ducklake_schema (schema_id BIGINT, begin_snapshot BIGINT, end_snapshot BIGINT, schema_name VARCHAR)")
+    connection.execute("CREATE TABLE ducklake_table (table_id BIGINT, begin_snapshot BIGINT, end_snapshot BIGINT, schema_id BIGINT, table_name VARCHAR)")
+    connection.execute("CREATE TABLE ducklake_column (column_id BIGINT, begin_snapshot BIGINT, end_snapshot BIGINT, table_id BIGINT, column_name VARCHAR)")
+    connection.execute("CREATE TABLE ducklake_partition_info (partition_id BIGINT, table_id BIGINT, begin_snapshot BIGINT, end_snapshot BIGINT)")
+    connection.execute("CREATE TABLE ducklake_partition_column (partition_id BIGINT, table_id BIGINT, partition_key_index BIGINT, column_id BIGINT, transform VARCHAR)")
+    connection.execute("INSERT INTO ducklake_schema VALUES (0, 0, NULL, 'main')")
+    connection.execute("INSERT INTO ducklake_table VALUES (1, 1, NULL, 0, 'events')")
+    connection.execute("INSERT INTO ducklake_column VALUES (1, 1, NULL, 1, 'ts'), (2, 1, NULL, 1, 'user_id')")
+    connection.execute("USE memory")
+    return connection
+
+
+def connector(connection: duckdb.DuckDBPyConnection, partition_by: list[str]) -> Connector:
+    stream = BrokerCnn(ingest_table="events", partition_by=partition_by)
+    cnn = Connector.model_construct(
+        duckdb_connection=connection,
+        SRC=SRC.model_construct(stream=stream),
+        DEST=DEST.model_construct(catalog=PgCnn(lake_alias="lake")),
+    )
+    cnn._table_columns["events"] = {"ts": "TIMESTAMP", "user_id": "BIGINT"}
+    return cnn
+
+
+def partitioned_by(connection: duckdb.DuckDBPyConnection, *keys: tuple[int, str]) -> None:
+    connection.execute('INSERT INTO "__ducklake_metadata_lake".ducklake_partition_info VALUES (1, 1, 1, NULL)')
+    for index, (column_id, transform) in enumerate(keys):
+        connection.execute(
+            'INSERT INTO "__ducklake_metadata_lake".ducklake_partition_column VALUES (1, 1, ?, ?, ?)', [index, column_id, transform]
+        )
+
+
+def test_partition_transform():
+    assert partition_transform("day(ts)") == ("ts", "day")
+    assert partition_transform("user_id") == ("user_id", "identity")
+
+
+def test_unpartitioned_table_is_altered_once(catalog):
+    cnn, cursor = connector(catalog, ["day(ts)"]), Recorder(catalog)
+    cnn._apply_partitioning(cursor, "events")
+    cnn._apply_partitioning(cursor, "events")
+    assert cursor.statements == ['ALTER TABLE events SET PARTITIONED BY (day("ts"));']
+
+
+def test_matching_partitioning_is_left_alone(catalog):
+    partitioned_by(catalog, (1, "day"), (2, "identity"))
+    cursor = Recorder(catalog)
+    connector(catalog, ["day(ts)", "user_id"])._apply_partitioning(cursor, "events")
+    assert cursor.statements == []
+
+
+def test_changed_partitioning_is_altered(catalog):
+    partitioned_by(catalog, (1, "month"))
+    cursor = Recorder(catalog)
+    connector(catalog, ["day(ts)"])._apply_partitioning(cursor, "events")
+    assert cursor.statements == ['ALTER TABLE events SET PARTITIONED BY (day("ts"));']
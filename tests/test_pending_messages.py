@@ -0,0 +1,58 @@
+from lake.connector.kafka import Connector, PendingMessages
+from lake.util.conf_loader import SRC, BrokerCnn
+
+
+class Message:
+    def __init__(self, topic: str, partition: int, offset: int, value: bytes | None):
+        self._topic, self._partition, self._offset, self._value = topic, partition, offset, value
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+
+class Consumer:
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def consume(self, num_messages=1, timeout=1.0):
+        return self.batches.pop(0) if self.batches else []
+
+
+def test_tombstones_advance_offsets_without_rows():
+    pending = PendingMessages()
+    pending.add(Message("t", 0, 0, b'{"id": 1}'))
+    pending.add(Message("t", 0, 1, None))
+    pending.add(Message("t", 1, 7, None))
+    assert (pending.rows, pending.bytes) == (1, 9)
+    assert pending.groups(by_topic=False) == {"": ([b'{"id": 1}'], [])}
+    assert {(tp.topic, tp.partition, tp.offset) for tp in pending.commit_offsets()} == {("t", 0, 2), ("t", 1, 8)}
+
+
+def test_drop_forgets_tombstone_only_partitions():
+    pending = PendingMessages()
+    pending.add(Message("t", 0, 0, b'{"id": 1}'))
+    pending.add(Message("t", 1, 7, None))
+    assert pending.drop({("t", 0), ("t", 1)}) == 1
+    assert (pending.rows, pending.bytes, pending.offsets) == (0, 0, {})
+
+
+def test_consume_batch_skips_tombstones():
+    stream = BrokerCnn(ingest_table="events", flush_rows=2)
+    cnn = Connector.model_construct(SRC=SRC.model_construct(stream=stream))
+    consumer = Consumer([[Message("t", 0, 0, b'{"id": 1}'), Message("t", 0, 1, None), Message("t", 0, 2, b'{"id": 2}')]])
+    cnn._consumers.append(consumer)
+    routed, offsets = next(cnn.consume_batch(consumer, timeout=0.1))
+    assert [(table, frame.column("id").to_pylist()) for table, frame in routed] == [("events", [1, 2])]
+    assert [(tp.topic, tp.partition, tp.offset) for tp in offsets] == [("t", 0, 3)]
@@ -0,0 +1,83 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from lake.connector.kafka import Connector
+from lake.util.conf_loader import SRC, BrokerCnn, RouteCnn
+
+
+def connector(*routes: RouteCnn) -> Connector:
+    # routing only needs the stream settings, no lake session or broker
+    stream = BrokerCnn(ingest_table="events", routes=list(routes))
+    return Connector.model_construct(SRC=SRC.model_construct(stream=stream))
+
+
+def orders_and_refunds() -> pa.Table:
+    return pa.Table.from_pylist(
+        [
+            {"type": "order", "id": 1, "amount": 10, "reason": None},
+            {"type": "refund", "id": 2, "amount": None, "reason": "broken"},
+            {"type": "order", "id": 3, "amount": 30, "reason": None},
+            {"type": "ping", "id": 4, "amount": None, "reason": None},
+        ]
+    )
+
+
+def test_route_frame_without_routes_keeps_ingest_table():
+    frame = orders_and_refunds()
+    assert connector().route_frame("shop", frame) == [("events", frame)]
+
+
+def test_route_frame_topic_route_keeps_whole_frame():
+    frame = orders_and_refunds()
+    routed = connector(RouteCnn(table="shop_events", topic="sh*")).route_frame("shop", frame)
+    assert routed == [("shop_events", frame)]
+
+
+def test_route_frame_splits_by_field_value():
+    cnn = connector(
+        RouteCnn(table="orders", field="type", value="order"),
+        RouteCnn(table="refunds", field="type", value="ref*"),
+    )
+    routed = dict(cnn.route_frame("shop", orders_and_refunds()))
+    assert routed["orders"].column("id").to_pylist() == [1, 3]
+    assert routed["refunds"].column("id").to_pylist() == [2]
+    assert routed["events"].column("id").to_pylist() == [4]
+    # columns that are empty in a split do not widen its table
+    assert "reason" not in routed["orders"].column_names
+    assert "amount" not in routed["refunds"].column_names
+
+
+def test_route_frame_first_match_wins():
+    cnn = connector(
+        RouteCnn(table="orders", field="type", value="order"),
+        RouteCnn(table="everything", field="type", value="*"),
+    )
+    routed = dict(cnn.route_frame("shop", orders_and_refunds()))
+    assert sorted(routed) == ["everything", "orders"]
+    assert routed["everything"].column("id").to_pylist() == [2, 4]
+
+
+def test_route_frame_compares_values_as_strings():
+    cnn = connector(RouteCnn(table="small", field="id", value="[12]"))
+    routed = dict(cnn.route_frame("shop", orders_and_refunds()))
+    assert routed["small"].column("id").to_pylist() == [1, 2]
+    assert routed["events"].column("id").to_pylist() == [3, 4]
+
+
+@pytest.mark.parametrize("frame_type", ["arrow", "pandas"])
+def test_route_frame_missing_field_falls_through(frame_type):
+    frame = orders_and_refunds()
+    if frame_type == "pandas":
+        frame = frame.to_pandas()
+    routed = connector(RouteCnn(table="tenants", field="tenant", value="*")).route_frame("shop", frame)
+    assert [table for table, _ in routed] == ["events"]
+
+
+def test_route_frame_splits_pandas_frames():
+    cnn = connector(RouteCnn(table="orders", field="type", value="order"))
+    routed = dict(cnn.route_frame("shop", orders_and_refunds().to_pandas()))
+    assert isinstance(routed["orders"], pd.DataFrame)
+    assert routed["orders"]["id"].tolist() == [1, 3]
+    assert routed["events"]["id"].tolist() == [2, 4]
+    assert "reason" not in routed["orders"].columns